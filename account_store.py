@@ -0,0 +1,126 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from metrics import cache_result
+
+logger = logging.getLogger(__name__)
+
+def account_id(api_key):
+    """Stable, non-reversible directory name for an API key"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+
+def _directory_size(path):
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass  # Removed while we were walking
+    return total
+
+class FrameCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (frame, size), least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """Return a cached DataFrame, loading and caching it on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                cache_result('frame', True)
+                # Shallow copy so callers can add columns without touching the cached frame
+                return self.entries[key][0].copy(deep=False)
+            self.misses += 1
+            cache_result('frame', False)
+
+        frame = loader()
+        size = int(frame.memory_usage(deep=True).sum())
+        with self.lock:
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = (frame, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+        return frame.copy(deep=False)
+
+    def evict_prefix(self, path_prefix):
+        """Drop every cached frame loaded from under a directory"""
+        with self.lock:
+            for key in [key for key in self.entries if str(key[0]).startswith(path_prefix)]:
+                _, size = self.entries.pop(key)
+                self.size -= size
+
+class AccountStore:
+    def __init__(self, root="data/accounts", quota_bytes=2 * 1024 ** 3, cache_bytes=256 * 1024 * 1024,
+                 check_interval=600):
+        self.root = root
+        self.quota_bytes = quota_bytes  # Disk budget shared by all accounts
+        self.check_interval = check_interval  # Seconds between quota sweeps, across all worker processes
+        self.frame_cache = FrameCache(cache_bytes)  # Hot tier in front of the on-disk store
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def account_dir(self, account):
+        """Data directory for an account id, marking the account as recently used"""
+        path = os.path.join(self.root, account)
+        os.makedirs(path, exist_ok=True)
+        # The marker's mtime drives least-recently-used eviction
+        with open(os.path.join(path, '.last_used'), 'w') as f:
+            f.write(str(time.time()))
+        return path
+
+    def enforce_quota(self, exclude=()):
+        """Delete least recently used accounts until the store fits in its disk quota.
+
+        Sizing every account walks the whole store, so the sweep runs in one worker process at a time
+        and at most once per check_interval; <root>/.quota_checked holds the time of the last one.
+        """
+        with self.lock, open(os.path.join(self.root, '.quota_checked'), 'a+') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return []  # Another worker is sweeping
+            f.seek(0)
+            checked_at = f.read().strip()
+            if checked_at and time.time() - float(checked_at) < self.check_interval:
+                return []
+            f.truncate(0)
+            f.write(str(time.time()))
+            f.flush()
+
+            accounts = []
+            for account in os.listdir(self.root):
+                path = os.path.join(self.root, account)
+                if not os.path.isdir(path):
+                    continue
+                marker = os.path.join(path, '.last_used')
+                last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0
+                accounts.append((last_used, account, path, _directory_size(path)))
+
+            total = sum(size for _, _, _, size in accounts)
+            evicted = []
+            for _, account, path, size in sorted(accounts):
+                if total <= self.quota_bytes:
+                    break
+                if account in exclude:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                self.frame_cache.evict_prefix(path)
+                total -= size
+                evicted.append(account)
+                logger.info("Evicted cached data for account %s...", account[:8])
+            return evicted
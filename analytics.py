@@ -0,0 +1,342 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from chart_cache import ChartCache, chart_key
+from fact_table import answer_totals
+from metrics import cache_result, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# name -> chart definition; charts register themselves with @register_chart
+CHARTS = {}
+
+SUBJECT_TYPE_COLORS = {
+    'radical': 'rgb(0, 170, 255)',
+    'kanji': 'rgb(255, 0, 170)',
+    'vocabulary': 'rgb(170, 0, 255)',
+    'kana_vocabulary': 'rgb(136, 68, 255)',
+}
+
+def register_chart(name, title, endpoints, hourly=False):
+    """Register a chart function over an AnalysisContext.
+
+    endpoints lists the curated datasets the chart reads; their versions form the chart's cache key.
+    Charts that depend on the current time set hourly=True so their cached figure expires each hour.
+    """
+    def decorator(func):
+        CHARTS[name] = {'name': name, 'title': title, 'endpoints': endpoints, 'hourly': hourly, 'build': func}
+        return func
+    return decorator
+
+def json_values(values):
+    """Column-level NaN/inf masking: convert an array-like to a JSON-safe list with None for missing values"""
+    series = pd.Series(values)
+    if pd.api.types.is_integer_dtype(series):
+        # Keep integers as Python ints rather than widening them to floats
+        return [None if pd.isna(value) else int(value) for value in series.astype(object)]
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        numbers = series.astype('float64')
+        return numbers.astype(object).where(np.isfinite(numbers), None).tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+class AnalysisContext:
+    def __init__(self, processor, subject_catalog=None, now=None):
+        self.processor = processor
+        self.subject_catalog = subject_catalog  # Shared subject index; falls back to the account's own subjects
+        self.now = now or datetime.now(timezone.utc)
+        self._datasets = {}
+        self._intermediates = {}
+
+    def dataset(self, endpoint):
+        """Curated table for an endpoint, loaded once and shared by every chart"""
+        if endpoint not in self._datasets:
+            if endpoint == 'subjects':
+                self._datasets[endpoint] = self._load_subjects()
+            elif endpoint == 'learner_facts':
+                self._datasets[endpoint] = self.processor.learner_facts(self.subject_catalog).frame
+            else:
+                self._datasets[endpoint] = self.processor.load_curated(endpoint)
+        return self._datasets[endpoint]
+
+    def _load_subjects(self):
+        """Subject id -> level/type/SRS system, from the shared catalog when available"""
+        if self.subject_catalog is not None and self.subject_catalog.index is not None:
+            index = self.subject_catalog.index
+            return index[[column for column in ['level', 'type', 'spaced_repetition_system_id'] if column in index]]
+        subjects = self.processor.load_curated('subjects', columns=['id', 'object', 'level', 'spaced_repetition_system_id'])
+        return subjects.rename(columns={'object': 'type'}).set_index('id')
+
+    def cached(self, name, compute):
+        """Memoise an intermediate result (e.g. a join) shared by several charts"""
+        if name not in self._intermediates:
+            self._intermediates[name] = compute()
+        return self._intermediates[name]
+
+    def version(self, endpoints):
+        """Combined version of the datasets a chart depends on"""
+        parts = []
+        for endpoint in endpoints:
+            if endpoint == 'subjects' and self.subject_catalog is not None and self.subject_catalog.version:
+                parts.append(f"subjects={self.subject_catalog.version}")
+                continue
+            curated = self.processor.catalog.latest('curated', endpoint)
+            if not curated:
+                raise FileNotFoundError(f"No curated data found for {endpoint}")
+            parts.append(f"{endpoint}={curated['source_hash']}")
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+def chart_figure(context, name, cache=None):
+    """Return (cache key, figure) for one registered chart, building it only when its inputs changed"""
+    chart = CHARTS[name]
+    if cache is None:
+        cache = ChartCache()
+
+    version = context.version(chart['endpoints'])
+    if chart['hourly']:
+        version += context.now.strftime(':%Y%m%d%H')
+    key = chart_key(name, version)
+
+    figure = cache.get(key)
+    cache_result('chart', figure is not None)
+    if figure is not None:
+        logger.debug("Using cached %s chart %s", name, key[:12])
+        return key, figure
+
+    with stage_timer('chart', chart=name):
+        figure = chart['build'](context)
+    cache.put(key, figure)
+    return key, figure
+
+def build_charts(context, names=None, cache=None):
+    """Build several charts over one shared context; a failing chart is reported, not fatal"""
+    results = {}
+    for name in names or list(CHARTS):
+        try:
+            key, figure = chart_figure(context, name, cache)
+            results[name] = {'title': CHARTS[name]['title'], 'key': key, 'figure': figure}
+        except Exception as e:
+            logger.exception("Error building %s chart", name)
+            results[name] = {'title': CHARTS[name]['title'], 'error': str(e)}
+    return results
+
+@register_chart('level_progression', 'Level Progression Analysis', ['level_progressions'])
+def level_progression_chart(context):
+    """Days spent on each level, colored fast / medium / long relative to the mean"""
+    level_progressions = context.dataset('level_progressions')
+    logger.debug("Charting %d level progressions", len(level_progressions))
+
+    time_spent = (pd.to_datetime(level_progressions['passed_at']) - pd.to_datetime(level_progressions['started_at'])).dt.days
+    mean_time = time_spent.mean()
+
+    # Bucket every level at once instead of looping over rows
+    days = time_spent.to_numpy(dtype='float64', na_value=np.nan)
+    colors = np.select(
+        [np.isnan(days), days < mean_time * 0.75, days < mean_time * 1.25],
+        ['rgb(200, 200, 200)', 'rgb(173, 216, 230)', 'rgb(255, 105, 180)'],  # Gray (no data), light blue (fast), hot pink (medium)
+        default='rgb(147, 112, 219)',  # Medium purple (long)
+    )
+    text_values = [value if value is not None else 'No data' for value in json_values(time_spent.round(1))]
+
+    trace = {
+        'type': 'bar',
+        'x': json_values(level_progressions['level']),
+        'y': json_values(time_spent),
+        'marker': {'color': colors.tolist()},
+        'text': text_values,
+        'textposition': 'auto',
+        'name': 'Time Spent (days)'
+    }
+    layout = {
+        'title': 'Level Progression vs Time Spent',
+        'xaxis': {'title': 'Level', 'tickmode': 'linear', 'tick0': 1, 'dtick': 1},
+        'yaxis': {'title': 'Time Spent (Days)', 'tickmode': 'linear', 'tick0': 0, 'dtick': 5},
+        'showlegend': False,
+        'template': 'plotly_white',
+        'height': 600,
+        'width': 800
+    }
+    return {'data': [trace], 'layout': layout}
+
+def review_statistics_with_levels(context):
+    """Visible subjects with review statistics, from the learner fact table; shared by the accuracy charts"""
+    def compute():
+        facts = context.dataset('learner_facts')
+        return facts[facts['meaning_correct'].notna().to_numpy() & ~facts['hidden'].fillna(False).to_numpy(dtype=bool)]
+    return context.cached('review_statistics_with_levels', compute)
+
+@register_chart('accuracy_by_level', 'Accuracy by Level', ['review_statistics', 'subjects'])
+def accuracy_by_level_chart(context):
+    """Share of correct answers per level, split by subject type"""
+    stats = review_statistics_with_levels(context)
+    correct, total = answer_totals(stats)
+    totals = pd.DataFrame({
+        'level': stats['level'],
+        'subject_type': stats['subject_type'].astype(str),
+        'correct': correct,
+        'total': total,
+    }).groupby(['subject_type', 'level'], observed=True)[['correct', 'total']].sum()
+    accuracy = (totals['correct'] / totals['total'].where(totals['total'] > 0)) * 100
+
+    traces = []
+    for subject_type, values in accuracy.groupby(level='subject_type'):
+        values = values.droplevel('subject_type')
+        traces.append({
+            'type': 'bar',
+            'name': subject_type.replace('_', ' ').title(),
+            'x': json_values(values.index),
+            'y': json_values(values.round(1)),
+            'marker': {'color': SUBJECT_TYPE_COLORS.get(subject_type)},
+        })
+    layout = {
+        'title': 'Accuracy by Level',
+        'barmode': 'group',
+        'xaxis': {'title': 'Level', 'tickmode': 'linear', 'tick0': 1, 'dtick': 1},
+        'yaxis': {'title': 'Accuracy (%)', 'range': [0, 100]},
+        'template': 'plotly_white',
+        'height': 500,
+        'width': 800
+    }
+    return {'data': traces, 'layout': layout}
+
+SRS_STAGE_GROUPS = ['Lessons', 'Apprentice', 'Guru', 'Master', 'Enlightened', 'Burned']
+
+def srs_stage_groups(stages):
+    """Map SRS stage numbers (0-9) to their WaniKani group names"""
+    stages = stages.to_numpy(dtype='float64', na_value=np.nan)
+    return np.select(
+        [stages == 0, stages <= 4, stages <= 6, stages == 7, stages == 8, stages == 9],
+        SRS_STAGE_GROUPS,
+        default='Locked',
+    )
+
+@register_chart('srs_stage_distribution', 'SRS Stage Distribution', ['assignments'])
+def srs_stage_distribution_chart(context):
+    """Number of items in each SRS group, stacked by subject type"""
+    assignments = context.dataset('assignments')
+    counts = pd.crosstab(
+        pd.Categorical(srs_stage_groups(assignments['srs_stage']), categories=SRS_STAGE_GROUPS),
+        assignments['subject_type'].astype(str),
+        dropna=False,
+    ).reindex(SRS_STAGE_GROUPS, fill_value=0)
+
+    traces = [{
+        'type': 'bar',
+        'name': subject_type.replace('_', ' ').title(),
+        'x': SRS_STAGE_GROUPS,
+        'y': json_values(counts[subject_type]),
+        'marker': {'color': SUBJECT_TYPE_COLORS.get(subject_type)},
+    } for subject_type in counts.columns]
+    layout = {
+        'title': 'SRS Stage Distribution',
+        'barmode': 'stack',
+        'xaxis': {'title': 'SRS Stage'},
+        'yaxis': {'title': 'Items'},
+        'template': 'plotly_white',
+        'height': 500,
+        'width': 800
+    }
+    return {'data': traces, 'layout': layout}
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+@register_chart('review_load_heatmap', 'Upcoming Review Load', ['assignments'], hourly=True)
+def review_load_heatmap_chart(context, days=7):
+    """Reviews coming due over the next week by weekday and hour (UTC); overdue reviews count as now"""
+    assignments = context.dataset('assignments')
+    available_at = pd.to_datetime(assignments['available_at'], utc=True)
+    active = assignments['srs_stage'].between(1, 8).fillna(False).to_numpy(dtype=bool) & available_at.notna().to_numpy()
+    horizon = context.now + pd.Timedelta(days=days)
+
+    due = available_at[active].clip(lower=context.now)
+    due = due[due < horizon]
+    load = np.zeros((7, 24), dtype=np.int64)
+    np.add.at(load, (due.dt.weekday.to_numpy(), due.dt.hour.to_numpy()), 1)
+
+    trace = {
+        'type': 'heatmap',
+        'z': load.tolist(),
+        'x': list(range(24)),
+        'y': WEEKDAYS,
+        'colorscale': 'Purples',
+        'hovertemplate': '%{y} %{x}:00 UTC<br>%{z} reviews<extra></extra>',
+    }
+    layout = {
+        'title': f'Upcoming Reviews (next {days} days)',
+        'xaxis': {'title': 'Hour (UTC)', 'dtick': 1},
+        'yaxis': {'title': 'Day', 'autorange': 'reversed'},
+        'template': 'plotly_white',
+        'height': 400,
+        'width': 800
+    }
+    return {'data': [trace], 'layout': layout}
+
+@register_chart('review_forecast', 'Review Forecast',
+                ['assignments', 'review_statistics', 'spaced_repetition_systems', 'subjects'], hourly=True)
+def review_forecast_chart(context, days=7):
+    """Simulated reviews per day over the next week, with a 10th-90th percentile band"""
+    from forecast import SrsTable, forecast_reviews, pass_rates
+    srs = SrsTable(context.dataset('spaced_repetition_systems'), context.dataset('spaced_repetition_systems_stages'))
+    subjects = context.dataset('subjects')
+    subject_systems = subjects['spaced_repetition_system_id'] if 'spaced_repetition_system_id' in subjects else None
+    forecast = forecast_reviews(context.dataset('assignments'), srs, pass_rates(context.dataset('review_statistics')),
+                                subject_systems, now=context.now, days=days, freq='D')
+
+    days_x = forecast.index.strftime('%a %d %b').tolist()
+    traces = [
+        {
+            'type': 'bar',
+            'name': 'Expected reviews',
+            'x': days_x,
+            'y': json_values(forecast['expected'].round(1)),
+            'marker': {'color': 'rgb(170, 0, 255)'},
+            'error_y': {
+                'type': 'data',
+                'symmetric': False,
+                'array': json_values((forecast['high'] - forecast['expected']).round(1)),
+                'arrayminus': json_values((forecast['expected'] - forecast['low']).round(1)),
+            },
+        },
+    ]
+    layout = {
+        'title': f'Review Forecast (next {days} days)',
+        'xaxis': {'title': 'Day (UTC)'},
+        'yaxis': {'title': 'Reviews'},
+        'showlegend': False,
+        'template': 'plotly_white',
+        'height': 500,
+        'width': 800
+    }
+    return {'data': traces, 'layout': layout}
+
+@register_chart('level_up_forecast', 'Level-Up Forecast',
+                ['level_progressions', 'review_statistics', 'spaced_repetition_systems', 'subjects'], hourly=True)
+def level_up_forecast_chart(context):
+    """Monte Carlo days until each upcoming level, median with 10th-90th percentile band"""
+    from forecast import SrsTable, pass_rates
+    from level_predictor import build_model, predict_level_up
+    srs = SrsTable(context.dataset('spaced_repetition_systems'), context.dataset('spaced_repetition_systems_stages'))
+    model = build_model(context.dataset('level_progressions'), context.dataset('subjects'), srs,
+                        pass_rates(context.dataset('review_statistics')), context.now)
+    prediction = predict_level_up(model)
+
+    levels = list(prediction['levels'])
+    bands = {band: [round(prediction['levels'][level][band], 1) for level in levels] for band in ['p10', 'p50', 'p90']}
+    traces = [
+        {'type': 'scatter', 'x': levels, 'y': bands['p90'], 'mode': 'lines', 'line': {'width': 0},
+         'name': '90th percentile', 'hoverinfo': 'skip'},
+        {'type': 'scatter', 'x': levels, 'y': bands['p10'], 'mode': 'lines', 'line': {'width': 0},
+         'fill': 'tonexty', 'fillcolor': 'rgba(170, 0, 255, 0.2)', 'name': '10th-90th percentile'},
+        {'type': 'scatter', 'x': levels, 'y': bands['p50'], 'mode': 'lines+markers',
+         'line': {'color': 'rgb(170, 0, 255)'}, 'name': 'Median'},
+    ]
+    layout = {
+        'title': f"Days Until Each Level (now level {prediction['current_level']})",
+        'xaxis': {'title': 'Level', 'tickmode': 'linear', 'dtick': 5},
+        'yaxis': {'title': 'Days From Now'},
+        'template': 'plotly_white',
+        'height': 500,
+        'width': 800
+    }
+    return {'data': traces, 'layout': layout}
@@ -1,111 +1,252 @@
-from flask import Flask, render_template, request, jsonify, session, Response
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, Response, url_for, send_file, send_from_directory
+import logging
 import os
-from data_fetcher import WaniKaniDataFetcher
-from data_processor import WaniKaniDataProcessor
-from Level_Progression_Analysis import generate_level_progression_html
-import pandas as pd
-from datetime import datetime
-import json
-import requests
-
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
-
-def validate_api_key(api_key):
+import re
+import threading
+from jobs import JobManager, QueueFullError
+from account_store import AccountStore, account_id
+from chart_cache import ChartCache
+from config import WANIKANI_API_URL, configure_logging
+from metrics import REGISTRY, profile_summary, profiled, stage_timer
+
+# The pipeline modules (pandas, numpy, pyarrow, plotly) are imported where they are used or in
+# Services.warm_up, so importing this module stays cheap and has no side effects
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('wanikani', __name__)
+PROFILE_DIR = os.path.join('data', 'profiles')
+
+class Services:
+    """State shared by every request of one app: job pool, account store, subject catalog and chart cache"""
+    def __init__(self):
+        # The pool starts its threads on the first submitted job, so a preloading master can fork safely
+        self.job_manager = JobManager(max_workers=int(os.getenv('ANALYSIS_WORKERS', '2')))  # Bounded pool for /analyze jobs
+        self.account_store = AccountStore(
+            quota_bytes=int(os.getenv('ACCOUNT_STORE_QUOTA_MB', '2048')) * 1024 * 1024,
+            cache_bytes=int(os.getenv('FRAME_CACHE_MB', '256')) * 1024 * 1024,
+        )  # Per-account data directories with an in-memory hot tier
+        self.chart_cache = ChartCache(
+            max_disk_bytes=int(os.getenv('CHART_CACHE_MB', '512')) * 1024 * 1024,
+        )  # Figures keyed by a hash of their input data
+        self._subject_catalog = None
+        self.lock = threading.Lock()
+
+    @property
+    def subject_catalog(self):
+        """Shared curriculum, fetched once for all accounts; created on first use"""
+        with self.lock:
+            if self._subject_catalog is None:
+                from subject_catalog import SubjectCatalog
+                self._subject_catalog = SubjectCatalog()
+            return self._subject_catalog
+
+    def warm_up(self):
+        """Import the analysis modules and load the subject index from disk.
+
+        Run once in a preloading server process before it forks, so every worker starts with them
+        already in memory and shares the pages copy-on-write.
+        """
+        import analytics, data_fetcher, data_processor, fact_table, forecast, level_predictor
+        index = self.subject_catalog.load()
+        logger.info("Warmed up with %s subjects", len(index) if index is not None else 'no cached')
+
+def create_app():
+    """Build the Flask app and its shared services"""
+    configure_logging()
+    app = Flask(__name__)
+    app.secret_key = os.urandom(24)  # For session management
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED') == '1'  # Allows ?profile=1 on /analyze
+    app.extensions['wanikani'] = Services()
+    app.register_blueprint(bp)
+    return app
+
+def get_services():
+    """Shared services of the app handling the current request"""
+    return current_app.extensions['wanikani']
+
+def __getattr__(name):
+    # `gunicorn app:app` and `flask --app app run` still work; the default app is built on first access
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def validate_api_key(api_key, scheduler):
     """Validate the WaniKani API key by making a test request"""
     try:
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Wanikani-Revision': '20170710'
         }
-        print(f"\nTesting API key validation...")
-        response = requests.get('https://api.wanikani.com/v2/user', headers=headers)
-        print(f"API validation response status: {response.status_code}")
+        response = scheduler.get(f'{WANIKANI_API_URL}/user', headers=headers)
         
         if response.status_code != 200:
-            print(f"API validation failed. Response: {response.text}")
+            logger.warning("API key validation failed with status %s", response.status_code)
             return False
             
-        print("API key validation successful")
+        logger.debug("API key validation successful")
         return True
         
     except Exception as e:
-        print(f"Error during API key validation: {str(e)}")
+        logger.error("Error during API key validation: %s", e)
         return False
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/analyze', methods=['POST'])
+def run_analysis(job, api_key, services):
+    """Run the full fetch -> process -> visualize pipeline for one account inside a job"""
+    from data_fetcher import ACCOUNT_ENDPOINTS, WaniKaniDataFetcher
+    from fetch_scheduler import FetchScheduler
+    from data_processor import WaniKaniDataProcessor
+    from analytics import AnalysisContext, build_charts
+    job_manager = services.job_manager
+    account_store = services.account_store
+    subject_catalog = services.subject_catalog
+    # Every request for this key in the job goes through one scheduler, so they share one rate limit
+    scheduler = FetchScheduler()
+    job_manager.progress(job, 'validating', 'Checking your API key')
+    with stage_timer('validate'):
+        valid = validate_api_key(api_key, scheduler)
+    if not valid:
+        raise ValueError('Invalid API key or unable to connect to WaniKani. Please check your API key and try again.')
+
+    # Every account gets its own data directory; the key is passed explicitly
+    account = account_id(api_key)
+    data_root = account_store.account_dir(account)
+    
+    # Fetch and process data
+    job_manager.progress(job, 'fetching', 'Downloading your WaniKani data')
+    try:
+        with stage_timer('fetch'):
+            # Subjects come from the shared catalog; only account-specific endpoints are fetched per user
+            subject_catalog.refresh(api_key, scheduler=scheduler)
+            fetcher = WaniKaniDataFetcher(api_key=api_key, data_root=data_root, scheduler=scheduler)
+            fetcher.fetch_all_data(endpoints=ACCOUNT_ENDPOINTS)
+    except Exception as e:
+        logger.exception("Error in data fetching")
+        raise RuntimeError(f'Error fetching data: {str(e)}')
+
+    job_manager.progress(job, 'processing', 'Processing your data')
+    try:
+        with stage_timer('process'):
+            processor = WaniKaniDataProcessor(data_root=data_root, frame_cache=account_store.frame_cache)
+            processor.process_all_files()
+            processor.learner_facts(subject_catalog)
+    except Exception as e:
+        logger.exception("Error in data processing")
+        raise RuntimeError(f'Error processing data: {str(e)}')
+
+    # Generate every registered chart from one shared, loaded-once dataset context
+    job_manager.progress(job, 'visualizing', 'Building your charts')
+    context = AnalysisContext(processor, subject_catalog)
+    with stage_timer('visualize'):
+        charts = build_charts(context, cache=services.chart_cache)
+    
+    level_chart = charts['level_progression']
+    if 'error' in level_chart:
+        raise RuntimeError(f'Error generating visualization: {level_chart["error"]}')
+    visualization_data = level_chart['figure']
+        
+    # Verify the data structure
+    if not isinstance(visualization_data, dict) or 'data' not in visualization_data or 'layout' not in visualization_data:
+        logger.error("Invalid visualization data structure of type %s", type(visualization_data).__name__)
+        raise RuntimeError('Invalid visualization data structure')
+    
+    response_data = {
+        'visualization': visualization_data,
+        'html_url': f"/charts/{level_chart['key']}.html",  # Exported lazily by chart_html
+        'charts': [
+            {
+                'name': name,
+                'title': chart['title'],
+                'figure': chart.get('figure'),
+                'html_url': f"/charts/{chart['key']}.html" if 'key' in chart else None,
+                'error': chart.get('error'),
+            }
+            for name, chart in charts.items()
+        ],
+        'message': 'Analysis complete!'
+    }
+    
+    # Keep the on-disk store within its quota, never evicting accounts with jobs in any worker
+    account_store.enforce_quota(exclude=job_manager.claimed_keys())
+    
+    job_manager.progress(job, 'done', 'Analysis complete!')
+    return response_data
+
+def run_profiled_analysis(job, api_key, services):
+    """run_analysis under cProfile; the stats are kept for /jobs/<job_id>/profile"""
+    with profiled(os.path.join(PROFILE_DIR, f"{job.id}.prof")):
+        response_data = run_analysis(job, api_key, services)
+    response_data['profile_url'] = f"/jobs/{job.id}/profile"
+    return response_data
+
+@bp.route('/analyze', methods=['POST'])
 def analyze():
     api_key = request.form.get('api_key')
     if not api_key:
-        print("No API key provided")
         return jsonify({'error': 'API key is required'}), 400
     
-    print(f"\nReceived analyze request with API key: {api_key[:5]}...")
+    # Profiling is opt-in per request and only when enabled for the deployment
+    task = run_profiled_analysis if current_app.config['PROFILING_ENABLED'] and request.args.get('profile') == '1' else run_analysis
     
+    # Concurrent requests for the same account share one job
     try:
-        # Validate the API key first
-        if not validate_api_key(api_key):
-            return jsonify({'error': 'Invalid API key or unable to connect to WaniKani. Please check your API key and try again.'}), 401
+        job_id = get_services().job_manager.submit(account_id(api_key), task, api_key, get_services())
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('wanikani.job_status', job_id=job_id),
+        'events_url': url_for('wanikani.job_events', job_id=job_id),
+    }), 202
 
-        # Set the API key in environment
-        os.environ['WANIKANI_API_KEY'] = api_key
-        
-        # Fetch and process data
-        try:
-            fetcher = WaniKaniDataFetcher()
-            fetcher.fetch_all_data()
-        except Exception as e:
-            print(f"Error in data fetching: {str(e)}")
-            return jsonify({'error': f'Error fetching data: {str(e)}'}), 500
-
-        try:
-            processor = WaniKaniDataProcessor()
-            processor.process_all_files()
-        except Exception as e:
-            print(f"Error in data processing: {str(e)}")
-            return jsonify({'error': f'Error processing data: {str(e)}'}), 500
-
-        # Generate the level progression visualization
-        try:
-            visualization_data = generate_level_progression_html()
-            print("\nVisualization data from generate_level_progression_html:")
-            print(json.dumps(visualization_data, indent=2))
-            
-            if isinstance(visualization_data, dict) and 'error' in visualization_data:
-                return jsonify({'error': f'Error generating visualization: {visualization_data["error"]}'}), 500
-                
-            # Verify the data structure
-            if not isinstance(visualization_data, dict) or 'data' not in visualization_data or 'layout' not in visualization_data:
-                print("Invalid visualization data structure")
-                print(f"Type: {type(visualization_data)}")
-                print(f"Keys: {visualization_data.keys() if isinstance(visualization_data, dict) else 'not a dict'}")
-                return jsonify({'error': 'Invalid visualization data structure'}), 500
-                
-            response_data = {
-                'visualization': visualization_data,
-                'message': 'Analysis complete!'
-            }
-            
-            print("\nFinal response data:")
-            print(json.dumps(response_data, indent=2))
-            
-            return jsonify(response_data)
-            
-        except Exception as e:
-            print(f"Error in visualization generation: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return jsonify({'error': f'Error generating visualization: {str(e)}'}), 500
-        
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
-        return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = get_services().job_manager.get(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job_manager = get_services().job_manager
+    # Jobs run by another worker process are streamed from their state file
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(job_manager.stream(job_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    path = os.path.join(PROFILE_DIR, f"{job_id}.prof")
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id) or not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(profile_summary(path), mimetype='text/plain')
+
+@bp.route('/metrics')
+def metrics():
+    # Prometheus text exposition format; each worker process reports its own counters
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/charts/<key>.html')
+def chart_html(key):
+    # Keys are SHA-256 hex digests; anything else cannot name a cached chart
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({'error': 'Chart not found'}), 404
+    path = get_services().chart_cache.html_path(key)
+    if path is None:
+        return jsonify({'error': 'Chart not found'}), 404
+    return send_file(os.path.abspath(path))
+
+@bp.route('/charts/plotly.min.js')
+def chart_plotly_js():
+    # One copy of plotly.js shared by every exported chart
+    return send_from_directory(os.path.abspath(get_services().chart_cache.html_dir), 'plotly.min.js')
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True) 
\ No newline at end of file
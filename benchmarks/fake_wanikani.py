@@ -0,0 +1,275 @@
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+from flask import Flask, jsonify, request
+
+# Account presets: the learner's current level and how many individual reviews they have made
+ACCOUNT_SIZES = {
+    'small': {'level': 5, 'reviews': 20000},
+    'medium': {'level': 20, 'reviews': 150000},
+    'large': {'level': 60, 'reviews': 500000},
+}
+
+# Curriculum shape per level; 60 levels of these give about 9,000 subjects, like the real one
+LEVEL_SUBJECTS = [('radical', 8), ('kanji', 35), ('vocabulary', 110)]
+SUBJECTS_PER_LEVEL = sum(count for _, count in LEVEL_SUBJECTS)
+MAX_LEVEL = 60
+
+# Page sizes used by the real API
+PAGE_SIZES = {'assignments': 500, 'review_statistics': 500}
+DEFAULT_PAGE_SIZE = 1000
+
+# Fixed clock so every run serves identical data
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SRS_INTERVALS = {
+    1: [None, 7200, 14400, 28800, 82800, 601200, 1206000, 2588400, 10364400, None],  # Accelerated (levels 1-2)
+    2: [None, 14400, 28800, 82800, 169200, 601200, 1206000, 2588400, 10364400, None],
+}
+
+def timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+class FakeAccount:
+    """Deterministic synthetic account; every record is derived from its id, so nothing is held in memory"""
+    def __init__(self, level=20, reviews=150000, seed=0):
+        self.level = level
+        self.review_count = reviews
+        self.seed = seed
+        # Level durations decide when the account started
+        self.level_days = [random.Random(f"{seed}:level:{lvl}").randint(7, 20) for lvl in range(1, level + 1)]
+        self.started_at = NOW - timedelta(days=sum(self.level_days))
+        self.level_started = [self.started_at + timedelta(days=sum(self.level_days[:index])) for index in range(level)]
+
+    def _rng(self, kind, record_id):
+        return random.Random(f"{self.seed}:{kind}:{record_id}")
+
+    def subject_level_type(self, subject_id):
+        level, offset = divmod(subject_id - 1, SUBJECTS_PER_LEVEL)
+        for subject_type, count in LEVEL_SUBJECTS:
+            if offset < count:
+                return level + 1, subject_type
+            offset -= count
+
+    def ids(self, endpoint):
+        """Ids of a collection, in the order the API pages through them"""
+        if endpoint == 'subjects':
+            return range(1, MAX_LEVEL * SUBJECTS_PER_LEVEL + 1)
+        if endpoint in ('assignments', 'review_statistics'):
+            return range(1, self.level * SUBJECTS_PER_LEVEL + 1)
+        if endpoint == 'level_progressions':
+            return range(1, self.level + 1)
+        if endpoint == 'reviews':
+            return range(1, self.review_count + 1)
+        if endpoint == 'spaced_repetition_systems':
+            return range(1, 3)
+        return range(0)
+
+    def updated_at(self, endpoint, record_id):
+        if endpoint == 'reviews':
+            return self.review_time(record_id)
+        return NOW - timedelta(days=1)
+
+    def review_time(self, review_id):
+        span = (NOW - self.started_at).total_seconds()
+        return self.started_at + timedelta(seconds=span * review_id / (self.review_count + 1))
+
+    def record(self, endpoint, record_id):
+        """Build one resource the way the API returns it"""
+        data = getattr(self, f"_{endpoint}")(record_id)
+        # Subjects are typed by their object; every other resource is named after its collection
+        object_name = self.subject_level_type(record_id)[1] if endpoint == 'subjects' else endpoint[:-1]
+        return {
+            'id': record_id,
+            'object': object_name,
+            'url': f"https://api.wanikani.com/v2/{endpoint}/{record_id}",
+            'data_updated_at': timestamp(self.updated_at(endpoint, record_id)),
+            'data': data,
+        }
+
+    def _subjects(self, subject_id):
+        level, subject_type = self.subject_level_type(subject_id)
+        data = {
+            'level': level,
+            'slug': f"{subject_type}-{subject_id}",
+            'characters': chr(0x4e00 + subject_id % 20000),
+            'created_at': '2012-02-27T19:55:19.000000Z',
+            'hidden_at': None,
+            'document_url': f"https://www.wanikani.com/{subject_type}/{subject_id}",
+            'lesson_position': subject_id % SUBJECTS_PER_LEVEL,
+            'meaning_mnemonic': 'Mnemonic text ' * 20,
+            'meanings': [{'meaning': f"meaning {subject_id}", 'primary': True, 'accepted_answer': True}],
+            'auxiliary_meanings': [],
+            'spaced_repetition_system_id': 1 if level <= 2 else 2,
+        }
+        if subject_type != 'radical':
+            data['readings'] = [{'reading': 'よみ', 'primary': True, 'accepted_answer': True, 'type': 'onyomi'}]
+            data['component_subject_ids'] = [max(1, subject_id - offset) for offset in (1, 2)]
+        if subject_type == 'vocabulary':
+            data['parts_of_speech'] = ['noun']
+            data['context_sentences'] = [{'en': 'An example sentence.', 'ja': '例文です。'}]
+        return data
+
+    def _assignments(self, assignment_id):
+        level, subject_type = self.subject_level_type(assignment_id)
+        rng = self._rng('assignment', assignment_id)
+        # Older levels are further along the SRS
+        age = self.level - level
+        srs_stage = min(9, max(0, age // 2 + rng.randint(0, 4))) if age else rng.randint(0, 5)
+        unlocked_at = self.level_started[level - 1]
+        started_at = unlocked_at + timedelta(hours=rng.randint(1, 48)) if srs_stage else None
+        return {
+            'subject_id': assignment_id,
+            'subject_type': subject_type,
+            'srs_stage': srs_stage,
+            'unlocked_at': timestamp(unlocked_at),
+            'started_at': timestamp(started_at) if started_at else None,
+            'passed_at': timestamp(started_at + timedelta(days=4)) if srs_stage >= 5 else None,
+            'burned_at': timestamp(started_at + timedelta(days=160)) if srs_stage == 9 else None,
+            'available_at': timestamp(NOW + timedelta(hours=rng.randint(-24, 24 * 30))) if 0 < srs_stage < 9 else None,
+            'created_at': timestamp(unlocked_at),
+            'hidden': False,
+        }
+
+    def _review_statistics(self, statistic_id):
+        _, subject_type = self.subject_level_type(statistic_id)
+        rng = self._rng('statistic', statistic_id)
+        meaning_correct, reading_correct = rng.randint(3, 30), rng.randint(3, 30) if subject_type != 'radical' else 0
+        return {
+            'subject_id': statistic_id,
+            'subject_type': subject_type,
+            'meaning_correct': meaning_correct,
+            'meaning_incorrect': rng.randint(0, 6),
+            'meaning_max_streak': meaning_correct,
+            'meaning_current_streak': rng.randint(1, meaning_correct),
+            'reading_correct': reading_correct,
+            'reading_incorrect': rng.randint(0, 6) if reading_correct else 0,
+            'reading_max_streak': reading_correct,
+            'reading_current_streak': rng.randint(1, reading_correct) if reading_correct else 0,
+            'percentage_correct': rng.randint(60, 100),
+            'created_at': timestamp(self.started_at),
+            'hidden': False,
+        }
+
+    def _level_progressions(self, level):
+        started_at = self.level_started[level - 1]
+        passed = level < self.level
+        return {
+            'level': level,
+            'created_at': timestamp(started_at),
+            'unlocked_at': timestamp(started_at),
+            'started_at': timestamp(started_at),
+            'passed_at': timestamp(started_at + timedelta(days=self.level_days[level - 1])) if passed else None,
+            'completed_at': None,
+            'abandoned_at': None,
+        }
+
+    def _reviews(self, review_id):
+        rng = self._rng('review', review_id)
+        subject_id = rng.randint(1, self.level * SUBJECTS_PER_LEVEL)
+        starting_stage = rng.randint(1, 8)
+        correct = rng.random() < 0.85
+        return {
+            'assignment_id': subject_id,
+            'subject_id': subject_id,
+            'spaced_repetition_system_id': 1 if self.subject_level_type(subject_id)[0] <= 2 else 2,
+            'starting_srs_stage': starting_stage,
+            'ending_srs_stage': starting_stage + 1 if correct else max(1, starting_stage - 1),
+            'incorrect_meaning_answers': 0 if correct else rng.randint(0, 2),
+            'incorrect_reading_answers': 0 if correct else rng.randint(1, 2),
+            'created_at': timestamp(self.review_time(review_id)),
+        }
+
+    def _spaced_repetition_systems(self, system_id):
+        intervals = SRS_INTERVALS[system_id]
+        return {
+            'name': 'Accelerated' if system_id == 1 else 'Default',
+            'description': '',
+            'unlocking_stage_position': 0,
+            'starting_stage_position': 1,
+            'passing_stage_position': 5,
+            'burning_stage_position': 9,
+            'created_at': '2020-06-09T00:00:00.000000Z',
+            'stages': [
+                {'position': position, 'interval': interval, 'interval_unit': 'seconds' if interval else None}
+                for position, interval in enumerate(intervals)
+            ],
+        }
+
+    def page(self, endpoint, after_id=0, updated_after=None):
+        """Records after a cursor, filtered like the API's updated_after, plus whether more pages follow"""
+        ids = self.ids(endpoint)
+        first = max(ids.start, after_id + 1)
+        if updated_after:
+            since = datetime.fromisoformat(updated_after.replace('Z', '+00:00'))
+            if endpoint == 'reviews':
+                # Reviews are evenly spaced in time, so the first match can be computed directly
+                span = (NOW - self.started_at).total_seconds()
+                offset = (since - self.started_at).total_seconds()
+                first = max(first, int(offset / span * (self.review_count + 1)) + 1)
+                while first < ids.stop and self.review_time(first) <= since:
+                    first += 1
+            elif self.updated_at(endpoint, ids.start) <= since:
+                first = ids.stop
+        page_ids = range(first, min(first + PAGE_SIZES.get(endpoint, DEFAULT_PAGE_SIZE), ids.stop))
+        total = max(0, ids.stop - first)
+        return [self.record(endpoint, record_id) for record_id in page_ids], total, page_ids.stop < ids.stop
+
+def create_app(account):
+    app = Flask(__name__)
+
+    @app.before_request
+    def require_token():
+        if not request.headers.get('Authorization', '').startswith('Bearer '):
+            return jsonify({'error': 'Unauthorized', 'code': 401}), 401
+
+    @app.route('/v2/user')
+    def user():
+        return jsonify({
+            'object': 'user',
+            'url': 'https://api.wanikani.com/v2/user',
+            'data_updated_at': timestamp(NOW),
+            'data': {
+                'id': f"fake-{account.seed}",
+                'username': 'benchmark',
+                'level': account.level,
+                'started_at': timestamp(account.started_at),
+                'subscription': {'active': True, 'type': 'lifetime', 'max_level_granted': MAX_LEVEL},
+            },
+        })
+
+    @app.route('/v2/<endpoint>')
+    def collection(endpoint):
+        after_id = int(request.args.get('page_after_id', 0))
+        updated_after = request.args.get('updated_after')
+        records, total, more = account.page(endpoint, after_id, updated_after)
+        next_url = None
+        if more:
+            next_url = f"{request.base_url}?page_after_id={records[-1]['id']}"
+            if updated_after:
+                next_url += f"&updated_after={updated_after}"
+        return jsonify({
+            'object': 'collection',
+            'url': request.url,
+            'pages': {'per_page': PAGE_SIZES.get(endpoint, DEFAULT_PAGE_SIZE), 'next_url': next_url, 'previous_url': None},
+            'total_count': total,
+            'data_updated_at': records[-1]['data_updated_at'] if records else None,
+            'data': records,
+        })
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic WaniKani v2 account for offline runs and benchmarks")
+    parser.add_argument('--size', choices=sorted(ACCOUNT_SIZES), default='medium')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    server = make_server(args.host, args.port, create_app(FakeAccount(seed=args.seed, **ACCOUNT_SIZES[args.size])), threaded=True)
+    print(f"Fake WaniKani API ({args.size} account) on http://{args.host}:{server.server_port}/v2", flush=True)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(REPO_ROOT, 'benchmarks', 'fake_wanikani.py')
+BENCHMARK_KEY = 'benchmark-api-key'
+
+# Stages run in order, each in a fresh process so its peak RSS is its own; later stages reuse earlier data
+STAGES = ['fetch', 'process', 'level_chart', 'analyze_cold', 'analyze_warm', 'backfill_reviews']
+
+def run_fetch():
+    from data_fetcher import WaniKaniDataFetcher
+    WaniKaniDataFetcher(api_key=BENCHMARK_KEY).fetch_all_data()
+
+def run_process():
+    from data_processor import WaniKaniDataProcessor
+    WaniKaniDataProcessor().process_all_files()
+
+def run_level_chart():
+    from Level_Progression_Analysis import generate_level_progression_html
+    result = generate_level_progression_html(export_html=True)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+def run_analyze():
+    import app as web
+    client = web.app.test_client()
+    response = client.post('/analyze', data={'api_key': BENCHMARK_KEY})
+    if response.status_code != 202:
+        raise RuntimeError(f"/analyze returned {response.status_code}: {response.get_data(as_text=True)}")
+    status_url = response.get_json()['status_url']
+    while True:
+        status = client.get(status_url).get_json()
+        if status['status'] == 'done':
+            return
+        if status['status'] == 'error':
+            raise RuntimeError(status['error'])
+        time.sleep(0.05)
+
+def run_backfill_reviews():
+    from data_fetcher import WaniKaniDataFetcher
+    from reviews_backfill import ReviewsBackfill
+    result = ReviewsBackfill(WaniKaniDataFetcher(api_key=BENCHMARK_KEY)).run()
+    if result['failed']:
+        raise RuntimeError(f"Review windows failed: {result['failed']}")
+
+STAGE_FUNCTIONS = {
+    'fetch': run_fetch,
+    'process': run_process,
+    'level_chart': run_level_chart,
+    'analyze_cold': run_analyze,
+    'analyze_warm': run_analyze,
+    'backfill_reviews': run_backfill_reviews,
+}
+
+def run_stage(stage):
+    """Run one stage in this process and print its latency and peak RSS as JSON on the last line"""
+    sys.path.insert(0, REPO_ROOT)
+    start = time.perf_counter()
+    STAGE_FUNCTIONS[stage]()
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Kilobytes on Linux
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak_kb / 1024}))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def disk_usage(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+def start_server(size, seed, port):
+    server = subprocess.Popen([sys.executable, FAKE_SERVER, '--size', size, '--seed', str(seed), '--port', str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/v2"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/user", headers={'Authorization': f'Bearer {BENCHMARK_KEY}'}, timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Fake WaniKani server did not start")
+
+def run_suite(args):
+    work_dir = tempfile.mkdtemp(prefix='wk-benchmark-')
+    server, url = start_server(args.size, args.seed, free_port())
+    env = dict(os.environ, WANIKANI_API_URL=url, WANIKANI_REQUESTS_PER_MINUTE=str(args.requests_per_minute),
+               WANIKANI_API_KEY=BENCHMARK_KEY)
+    results = []
+    try:
+        for stage in args.stages:
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--stage', stage],
+                                       cwd=work_dir, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stdout[-2000:], completed.stderr[-2000:], sep='\n')
+                raise RuntimeError(f"Benchmark stage {stage} failed")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result.update({'stage': stage, 'disk_mb': disk_usage(work_dir) / (1024 * 1024)})
+            results.append(result)
+            print(f"{stage:<18}{result['seconds']:>10.2f} s{result['peak_rss_mb']:>10.1f} MB RSS{result['disk_mb']:>10.1f} MB on disk")
+    finally:
+        server.terminate()
+        server.wait()
+        if args.keep:
+            print(f"Benchmark data kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'size': args.size,
+        'seed': args.seed,
+        'requests_per_minute': args.requests_per_minute,
+        'python': sys.version.split()[0],
+        'stages': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved benchmark report to {args.output}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks against a local WaniKani API stand-in")
+    parser.add_argument('--size', choices=['small', 'medium', 'large'], default='medium')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--requests-per-minute', type=int, default=60000,
+                        help="Client rate limit; the default effectively removes it so our own code is measured")
+    parser.add_argument('--output', help="Write the results as JSON, e.g. to compare runs")
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark data directory")
+    parser.add_argument('--stage', choices=STAGES, help=argparse.SUPPRESS)  # Internal: run a single stage
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args.stage)
+    else:
+        run_suite(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump when chart code changes so figures cached by older code are not served
+CHART_VERSION = 1
+
+def chart_key(chart_name, source_hash):
+    """Content address of a chart: the chart, its code version and the hash of its input data"""
+    return hashlib.sha256(f"{chart_name}:{CHART_VERSION}:{source_hash}".encode('utf-8')).hexdigest()
+
+def _touch(path):
+    """Mark a cached file as recently used; its mtime drives disk eviction"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass  # Evicted in the meantime
+
+class ChartCache:
+    def __init__(self, cache_dir="data/charts", html_dir="Analysis Images", max_entries=256,
+                 max_disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir  # Figure JSON, shared between worker processes
+        self.html_dir = html_dir  # Lazily exported standalone HTML
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes  # Budget for the figure JSON and HTML exports together
+        self.disk_bytes = None  # Running estimate since the last scan; None until the first one
+        self.figures = OrderedDict()  # In-memory tier, least recently used first
+        self.lock = threading.Lock()
+
+    def _figure_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Cached figure for a key from memory, then disk, or None"""
+        with self.lock:
+            if key in self.figures:
+                self.figures.move_to_end(key)
+                return self.figures[key]
+
+        path = self._figure_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                figure = json.load(f)
+        except FileNotFoundError:
+            return None
+        _touch(path)
+        self._remember(key, figure)
+        return figure
+
+    def put(self, key, figure):
+        """Store a figure under its key; writing the JSON also checks that it serialises"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._figure_path(key)
+        # Workers building the same chart write the same content, so each needs only its own temp file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{key}.", suffix='.part')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(figure, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+            # Another worker stored the same figure first
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._remember(key, figure)
+        try:
+            self._account_disk(os.path.getsize(path))
+        except FileNotFoundError:
+            pass  # Evicted by another worker already
+
+    def _cached_files(self):
+        """(mtime, size, path) of every evictable file in the disk tier"""
+        files = []
+        for directory, suffix in ((self.cache_dir, '.json'), (self.html_dir, '.html')):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.name.endswith(suffix) and entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Evicted by another worker while we were scanning
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _account_disk(self, size):
+        """Add newly written bytes to the estimate and evict once it passes the budget.
+
+        The directories are only scanned on the first write and when the estimate overflows; other
+        workers' writes are picked up by those scans. Eviction frees down to 80% of the budget so the
+        next scan is some way off.
+        """
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += size
+                if self.disk_bytes <= self.max_disk_bytes:
+                    return
+            files = self._cached_files()
+            total = sum(file_size for _, file_size, _ in files)
+            if total > self.max_disk_bytes:
+                target = self.max_disk_bytes * 0.8
+                evicted = 0
+                for _, file_size, path in sorted(files):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass  # Another worker evicted it first
+                    total -= file_size
+                    evicted += 1
+                logger.info("Evicted %d cached chart files, %.1f MB left on disk", evicted, total / 1024 ** 2)
+            self.disk_bytes = total
+
+    def _remember(self, key, figure):
+        with self.lock:
+            self.figures[key] = figure
+            self.figures.move_to_end(key)
+            while len(self.figures) > self.max_entries:
+                self.figures.popitem(last=False)
+
+    def html_path(self, key, name='chart'):
+        """Export a cached figure as HTML on first request, sharing a single plotly.min.js"""
+        filename = f"{name}_{key[:16]}.html"
+        path = os.path.join(self.html_dir, filename)
+        if os.path.exists(path):
+            _touch(path)
+            return path
+
+        figure = self.get(key)
+        if figure is None:
+            return None
+
+        import plotly.graph_objects as go
+        os.makedirs(self.html_dir, exist_ok=True)
+        # 'directory' writes plotly.min.js next to the HTML once and references it instead of embedding it
+        go.Figure(data=figure['data'], layout=figure['layout']).write_html(
+            path, include_plotlyjs='directory', full_html=True)
+        logger.info("Saved chart HTML to %s", path)
+        self._account_disk(os.path.getsize(path))
+        return path
@@ -0,0 +1,243 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Quantiles reported for every distribution
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+class LogHistogram:
+    """Mergeable histogram over log-spaced bins, so quantiles of any number of accounts can be combined.
+
+    Each account adds its own values; merging two histograms adds their bin counts. Quantiles are
+    interpolated within a bin, so they are off by at most one bin width (about 3%).
+    """
+    def __init__(self, low=0.01, high=3650.0, bins=400):
+        self.edges = np.geomspace(low, high, bins + 1)
+        self.counts = np.zeros(bins + 2, dtype=np.int64)  # Plus underflow and overflow bins
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        np.add.at(self.counts, np.searchsorted(self.edges, values, side='right'), 1)
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Approximate q-th quantile, or None when the histogram is empty"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, rank, side='left'))
+        # Bin i covers [edges[i - 1], edges[i]); the outer bins are bounded by the observed min and max
+        lower = self.edges[index - 1] if index > 0 else self.min
+        upper = self.edges[index] if index < len(self.edges) else self.max
+        lower, upper = max(lower, self.min), min(upper, self.max)
+        before = cumulative[index - 1] if index > 0 else 0
+        fraction = (rank - before) / self.counts[index] if self.counts[index] else 0.0
+        return float(lower + (upper - lower) * fraction)
+
+    def summary(self):
+        summary = {'count': self.count, 'mean': self.total / self.count if self.count else None}
+        summary.update({f"p{int(q * 100)}": self.quantile(q) for q in QUANTILES})
+        return summary
+
+class CohortStats:
+    """Aggregates over many accounts; every part merges by addition, so per-account results combine in any order"""
+    def __init__(self):
+        self.accounts = 0
+        self.failed = 0
+        self.level_days = {}  # Level -> LogHistogram of days spent on it
+        self.all_level_days = LogHistogram()
+        self.current_levels = Counter()
+        self.answers = Counter()  # (subject type, 'correct' or 'total') -> answers
+        self.srs_groups = Counter()
+
+    def merge(self, other):
+        self.accounts += other.accounts
+        self.failed += other.failed
+        for level, histogram in other.level_days.items():
+            self.level_days.setdefault(level, LogHistogram()).merge(histogram)
+        self.all_level_days.merge(other.all_level_days)
+        self.current_levels.update(other.current_levels)
+        self.answers.update(other.answers)
+        self.srs_groups.update(other.srs_groups)
+
+    def report(self):
+        subject_types = sorted({subject_type for subject_type, _ in self.answers})
+        return {
+            'accounts': self.accounts,
+            'failed': self.failed,
+            'days_per_level': self.all_level_days.summary(),
+            'days_by_level': {level: self.level_days[level].summary() for level in sorted(self.level_days)},
+            'current_levels': {level: self.current_levels[level] for level in sorted(self.current_levels)},
+            'accuracy_by_type': {
+                subject_type: round(100 * self.answers[subject_type, 'correct'] / self.answers[subject_type, 'total'], 2)
+                for subject_type in subject_types if self.answers[subject_type, 'total']
+            },
+            'srs_groups': dict(self.srs_groups),
+        }
+
+# Per worker process: the shared subject index, loaded once by the pool initializer
+_subject_catalog = None
+
+def _init_worker(shared_dir, log_level):
+    global _subject_catalog
+    configure_logging(log_level)
+    from subject_catalog import SubjectCatalog
+    _subject_catalog = SubjectCatalog(shared_dir)
+    _subject_catalog.load()
+
+def account_stats(processor):
+    """One account's contribution to the cohort, from its curated tables"""
+    from analytics import srs_stage_groups
+    from fact_table import answer_totals
+    stats = CohortStats()
+    stats.accounts = 1
+
+    levels = processor.load_curated('level_progressions', columns=['level', 'started_at', 'passed_at'])
+    # CSV storage returns timestamps as text, so parse them like the level progression chart does
+    started_at = pd.to_datetime(levels['started_at'], utc=True)
+    passed_at = pd.to_datetime(levels['passed_at'], utc=True)
+    levels = levels[started_at.notna()]
+    days = ((passed_at - started_at)[started_at.notna()]).dt.total_seconds() / 86400
+    for level, value in zip(levels['level'], days):
+        if not np.isnan(value):
+            stats.level_days.setdefault(int(level), LogHistogram()).add([value])
+    stats.all_level_days.add(days.dropna())
+    if len(levels):
+        stats.current_levels[int(levels['level'].max())] += 1
+
+    facts = processor.learner_facts(_subject_catalog).frame
+    correct, total = answer_totals(facts)
+    for subject_type, values in correct.groupby(facts['subject_type'], observed=True):
+        stats.answers[str(subject_type), 'correct'] += int(values.sum())
+    for subject_type, values in total.groupby(facts['subject_type'], observed=True):
+        stats.answers[str(subject_type), 'total'] += int(values.sum())
+    started = facts['srs_stage'].notna()
+    stats.srs_groups.update(srs_stage_groups(facts.loc[started, 'srs_stage'].astype('float64')).tolist())
+    return stats
+
+def analyze_account(account, accounts_root):
+    """Pool task: fetch (for an API key), process and summarize one account, returning its CohortStats"""
+    from account_store import account_id
+    from data_fetcher import ACCOUNT_ENDPOINTS, WaniKaniDataFetcher
+    from data_processor import WaniKaniDataProcessor
+    try:
+        if account.get('api_key'):
+            data_root = os.path.join(accounts_root, account_id(account['api_key']))
+            fetcher = WaniKaniDataFetcher(api_key=account['api_key'], data_root=data_root)
+            # Accounts run in parallel processes, so each fetches its endpoints one at a time
+            for endpoint in ACCOUNT_ENDPOINTS:
+                fetcher.fetch_and_save(endpoint)
+        else:
+            data_root = account['data_root']
+        processor = WaniKaniDataProcessor(data_root=data_root, max_workers=1)
+        processor.process_all_files()
+        return account_stats(processor)
+    except Exception as e:
+        logger.error("Error analyzing account %s: %s", account['name'], e)
+        stats = CohortStats()
+        stats.failed = 1
+        return stats
+
+def read_accounts(keys_file=None, account_dirs=()):
+    """Accounts to analyze: API keys from a file (one per line, '-' for stdin) and existing account directories"""
+    if keys_file:
+        f = sys.stdin if keys_file == '-' else open(keys_file, 'r', encoding='utf-8')
+        with f:
+            for number, line in enumerate(f, 1):
+                key = line.strip()
+                if key and not key.startswith('#'):
+                    yield {'name': f"key #{number}", 'api_key': key}
+    for data_root in account_dirs:
+        yield {'name': data_root, 'data_root': data_root}
+
+def refresh_subjects(accounts, shared_dir):
+    """Sync the shared subject catalog once with the first key, before any worker needs it; returns the accounts"""
+    from subject_catalog import SubjectCatalog
+    first = next(accounts, None)
+    if first is None:
+        return iter(())
+    if first.get('api_key'):
+        SubjectCatalog(shared_dir).refresh(first['api_key'])
+    return itertools.chain([first], accounts)
+
+def run_cohort(accounts, workers=None, accounts_root="data/accounts", shared_dir="data/shared", log_level='WARNING'):
+    """Analyze accounts across a process pool and merge their statistics.
+
+    At most two tasks per worker are queued at a time, so thousands of accounts can be streamed
+    from a file without building them all up front.
+    """
+    workers = workers or os.cpu_count() or 1
+    cohort = CohortStats()
+    pending = set()
+    done_count = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(shared_dir, log_level)) as pool:
+        for account in accounts:
+            pending.add(pool.submit(analyze_account, account, accounts_root))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    cohort.merge(future.result())
+                done_count += len(finished)
+                logger.info("Analyzed %d accounts", done_count)
+        for future in pending:
+            cohort.merge(future.result())
+    return cohort
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch, process and summarize many accounts into one cohort report")
+    parser.add_argument('--keys-file', help="File with one WaniKani API key per line, or - for stdin")
+    parser.add_argument('--account-dirs', nargs='*', default=[],
+                        help="Existing per-account data directories to analyze without fetching")
+    parser.add_argument('--workers', type=int, default=None, help="Accounts analyzed in parallel (default: CPU count)")
+    parser.add_argument('--accounts-root', default="data/accounts", help="Where fetched accounts are stored")
+    parser.add_argument('--shared-dir', default="data/shared", help="Shared subject catalog directory")
+    parser.add_argument('--worker-log-level', default='WARNING', help="Log level inside the worker processes")
+    parser.add_argument('--output', help="Write the report as JSON instead of printing it")
+    args = parser.parse_args()
+    if not args.keys_file and not args.account_dirs:
+        parser.error("Give --keys-file and/or --account-dirs")
+
+    configure_logging()
+    accounts = refresh_subjects(read_accounts(args.keys_file, args.account_dirs), args.shared_dir)
+    cohort = run_cohort(accounts, workers=args.workers,
+                        accounts_root=args.accounts_root, shared_dir=args.shared_dir,
+                        log_level=args.worker_log_level)
+    report = cohort.report()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info("Saved cohort report for %d accounts to %s", cohort.accounts, args.output)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,50 @@
+import json
+import logging
 import os
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get API key from environment variables
+# Get API key from environment variables (only needed for command-line runs; the web app passes keys explicitly)
 WANIKANI_API_KEY = os.getenv('WANIKANI_API_KEY')
 
-if not WANIKANI_API_KEY:
-    raise ValueError("Wanikani API key not found in environment variables. Please check the .env file.") 
\ No newline at end of file
+def get_api_key():
+    """Return the API key from the environment, raising if it is not set"""
+    if not WANIKANI_API_KEY:
+        raise ValueError("Wanikani API key not found in environment variables. Please check the .env file.")
+    return WANIKANI_API_KEY
+
+# Base URL of the WaniKani API; point it at a local stand-in (see benchmarks/) for offline runs
+WANIKANI_API_URL = os.getenv('WANIKANI_API_URL', 'https://api.wanikani.com/v2').rstrip('/')
+
+# Log verbosity and format ('text', or 'json' for one structured record per line)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log record, including any extra= fields"""
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level=None, log_format=None):
+    """Set up root logging once for the app or a command-line run"""
+    handler = logging.StreamHandler()
+    if (log_format or LOG_FORMAT) == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or LOG_LEVEL)
@@ -1,190 +1,443 @@
 import os
 import json
+import logging
+import tempfile
 import pandas as pd
 from datetime import datetime, timedelta
-import requests
-import shutil
-from config import WANIKANI_API_KEY
+import threading
+from config import WANIKANI_API_URL, configure_logging, get_api_key
+from fetch_scheduler import FetchScheduler
+from ndjson_store import append_records, iter_record_chunks, iter_records, write_records
+from storage import get_storage
+from snapshot_catalog import SnapshotCatalog, file_hash
+from snapshot_archive import SnapshotArchive
+from metrics import API_PAGES, ROWS_PROCESSED, cache_result, stage_timer
+
+logger = logging.getLogger(__name__)
+
+ALL_ENDPOINTS = [
+    'subjects',
+    'assignments',
+    'level_progressions',
+    'review_statistics',
+    'spaced_repetition_systems'
+]
+
+# Subjects are the same curriculum for every account and come from the shared SubjectCatalog
+ACCOUNT_ENDPOINTS = [endpoint for endpoint in ALL_ENDPOINTS if endpoint != 'subjects']
 
 class WaniKaniDataFetcher:
-    def __init__(self, cache_duration_hours=168):  # Changed to 168 hours (1 week)
-        self.base_url = "https://api.wanikani.com/v2"
+    def __init__(self, cache_duration_hours=168, incremental=True, scheduler=None, chunk_size=5000, storage_format=None,
+                 catalog=None, api_key=None, data_root="data", base_url=None,
+                 archive_retention_days=365, archive_max_deltas=30):  # Changed to 168 hours (1 week)
+        self.base_url = base_url or WANIKANI_API_URL
         self.headers = {
-            "Authorization": f"Bearer {WANIKANI_API_KEY}",
+            "Authorization": f"Bearer {api_key or get_api_key()}",
             "Wanikani-Revision": "20170710"
         }
-        self.raw_data_dir = "data/raw"
-        self.processed_data_dir = "data/processed"
-        self.archive_dir = "data/archive"  # New archive directory
+        self.data_root = data_root  # Per-account directory when serving many users
+        self.raw_data_dir = os.path.join(data_root, "raw")
+        self.processed_data_dir = os.path.join(data_root, "processed")
+        self.archive_dir = os.path.join(data_root, "archive")  # Compressed base + delta history of raw snapshots
+        self.staging_dir = os.path.join(data_root, "staging")  # In-progress snapshots
         self.cache_duration = timedelta(hours=cache_duration_hours)
+        self.sync_state_path = os.path.join(data_root, "sync_state.json")  # Last successful sync per endpoint
+        self.incremental = incremental
+        self.scheduler = scheduler or FetchScheduler()  # Pooled, rate-limited HTTP client
+        self._state_lock = threading.Lock()  # Endpoints sync concurrently
+        self.chunk_size = chunk_size  # Records per chunk when building processed outputs
+        self.storage = get_storage(storage_format)  # Columnar by default, CSV on request
         
         # Create directories if they don't exist
         os.makedirs(self.raw_data_dir, exist_ok=True)
         os.makedirs(self.processed_data_dir, exist_ok=True)
         os.makedirs(self.archive_dir, exist_ok=True)
-
-    def _get_latest_file(self, directory, prefix):
-        """Get the most recent file for a given endpoint"""
-        files = [f for f in os.listdir(directory) if f.startswith(prefix)]
-        if not files:
-            return None
+        os.makedirs(self.staging_dir, exist_ok=True)
         
-        # Sort by timestamp in filename (newest first)
-        latest_file = sorted(files, reverse=True)[0]
-        return os.path.join(directory, latest_file)
-
-    def _is_cache_valid(self, filepath):
-        """Check if the cached file is still valid"""
-        if not filepath or not os.path.exists(filepath):
-            return False
-        
-        # Extract timestamp from filename (format: XXXX_YYYYMMDD_HHMMSS)
-        filename = os.path.basename(filepath)
-        timestamp_str = filename.split('_')[-2] + '_' + filename.split('_')[-1].split('.')[0]
-        file_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-        
-        # Check if file is older than cache duration
-        return datetime.now() - file_time < self.cache_duration
+        # Snapshot lookups go through the catalog instead of scanning directories
+        self.catalog = catalog or SnapshotCatalog(os.path.join(data_root, "catalog.sqlite"))
+        self.archive = SnapshotArchive(self.archive_dir, retention_days=archive_retention_days,
+                                       max_deltas=archive_max_deltas)
+        if not self.catalog.has_layer('raw'):
+            self.catalog.import_directory('raw', self.raw_data_dir)
+            self.catalog.import_directory('processed', self.processed_data_dir)
 
     def _archive_old_files(self, endpoint):
-        """Archive files older than cache duration for a given endpoint"""
-        current_time = datetime.now()
-        
-        # Archive raw files
-        raw_files = [f for f in os.listdir(self.raw_data_dir) if f.startswith(f"{endpoint}_")]
-        for file in raw_files:
-            filepath = os.path.join(self.raw_data_dir, file)
-            # Extract timestamp (format: XXXX_YYYYMMDD_HHMMSS)
-            timestamp_str = file.split('_')[-2] + '_' + file.split('_')[-1].split('.')[0]
-            file_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-            
-            if current_time - file_time >= self.cache_duration:
-                # Create archive subdirectory if it doesn't exist
-                archive_subdir = os.path.join(self.archive_dir, endpoint)
-                os.makedirs(archive_subdir, exist_ok=True)
-                
-                # Move file to archive
-                shutil.move(filepath, os.path.join(archive_subdir, file))
-                print(f"Archived {file} to {archive_subdir}")
-
-        # Archive processed files
-        processed_files = [f for f in os.listdir(self.processed_data_dir) if f.startswith(f"{endpoint}_")]
-        for file in processed_files:
-            filepath = os.path.join(self.processed_data_dir, file)
-            # Extract timestamp (format: XXXX_YYYYMMDD_HHMMSS)
-            timestamp_str = file.split('_')[-2] + '_' + file.split('_')[-1].split('.')[0]
-            file_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-            
-            if current_time - file_time >= self.cache_duration:
-                # Create archive subdirectory if it doesn't exist
-                archive_subdir = os.path.join(self.archive_dir, endpoint)
-                os.makedirs(archive_subdir, exist_ok=True)
-                
-                # Move file to archive
-                shutil.move(filepath, os.path.join(archive_subdir, file))
-                print(f"Archived {file} to {archive_subdir}")
+        """Fold raw snapshots older than cache duration into the delta archive and drop their processed tables"""
+        self.archive.migrate_legacy(endpoint)
+        for entry in self.catalog.expired('raw', endpoint, self.cache_duration):
+            if os.path.exists(entry['path']):
+                self.archive.add(endpoint, entry['path'], datetime.fromisoformat(entry['created_at']),
+                                 source_hash=entry['content_hash'])
+                os.remove(entry['path'])
+            self.catalog.set_status(entry['path'], 'archived')
+        # Processed tables can always be rebuilt from a raw version, so they are not kept
+        for entry in self.catalog.expired('processed', endpoint, self.cache_duration):
+            if os.path.exists(entry['path']):
+                os.remove(entry['path'])
+            self.catalog.set_status(entry['path'], 'deleted')
 
-    def fetch_endpoint(self, endpoint, params=None, force_refresh=False):
-        """Fetch data from a WaniKani endpoint with pagination handling"""
-        url = f"{self.base_url}/{endpoint}"
-        all_data = []
+    def records_as_of(self, endpoint, timestamp):
+        """Raw records of an endpoint as they were at timestamp, from a live snapshot or the archive"""
+        # Forced refreshes keep older snapshots active until they expire, so any of them can be the answer
+        entry = self.catalog.active_as_of('raw', endpoint, SnapshotArchive.local_time(timestamp))
+        if entry and os.path.exists(entry['path']):
+            return list(iter_records(entry['path']))
+        version = self.archive.as_of(endpoint, timestamp)
+        if version is None:
+            raise LookupError(f"No {endpoint} data archived at or before {timestamp}")
+        return version[1]
+
+    def _load_sync_state(self):
+        """Load the per-endpoint sync state (last sync time, ETag, Last-Modified)"""
+        if not os.path.exists(self.sync_state_path):
+            return {}
+        with open(self.sync_state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_sync_state(self, endpoint, endpoint_state):
+        """Persist the sync state for a single endpoint"""
+        with self._state_lock:
+            state = self._load_sync_state()
+            state[endpoint] = endpoint_state
+            # Written aside and renamed so a crash mid-write never leaves truncated JSON behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.sync_state_path),
+                                            prefix='.sync_state.', suffix='.part')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.sync_state_path)
+
+    def _iter_pages(self, endpoint, params=None, conditional_headers=None, meta=None, start_url=None):
+        """Yield the records of an endpoint one page at a time, filling in response metadata.
+
+        meta['next_url'] is the cursor of the page after the one just yielded. Passing it back as start_url
+        continues a collection from there; the first page's metadata is then expected to be in meta already.
+        """
+        url = start_url or f"{self.base_url}/{endpoint}"
+        if meta is None:
+            meta = {}
+        for key in ['etag', 'last_modified', 'data_updated_at']:
+            meta.setdefault(key, None)
+        meta.update({'not_modified': False, 'next_url': None})
         
         # Add specific parameters for reviews endpoint
         if endpoint == 'reviews':
-            if params is None:
-                params = {}
-            # Add parameters to get all reviews
-            params.update({
-                'hidden': 'false',
-                'updated_after': '2000-01-01T00:00:00.000000Z'  # Start from a very old date to get all reviews
-            })
+            params = dict(params or {})
+            params['hidden'] = 'false'
+            # Start from a very old date to get all reviews unless a sync point was given
+            params.setdefault('updated_after', '2000-01-01T00:00:00.000000Z')
         
-        print(f"Fetching {endpoint} with URL: {url}")
-        print(f"Using parameters: {params}")
+        logger.debug("Fetching %s from %s with parameters %s", endpoint, url, params)
+        
+        # Conditional headers only apply to the first page of the collection
+        headers = dict(self.headers, **(conditional_headers or {}))
+        first_page = True
+        if start_url:
+            # The cursor already carries the query string
+            params = None
+            headers = self.headers
+            first_page = False
+        total_items = 0
         
         while url:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.scheduler.get(url, headers=headers, params=params)
+            if response.status_code == 304:
+                logger.info("%s not modified since last sync", endpoint)
+                meta['not_modified'] = True
+                break
             response.raise_for_status()
             data = response.json()
             
-            print(f"Response for {endpoint}: {data.get('total_count', 'N/A')} total items")
+            if first_page:
+                meta['etag'] = response.headers.get('ETag')
+                meta['last_modified'] = response.headers.get('Last-Modified')
+                meta['data_updated_at'] = data.get('data_updated_at')
+                headers = self.headers
+                first_page = False
+            
+            logger.debug("Response for %s: %s total items", endpoint, data.get('total_count', 'N/A'))
             
             # Handle the nested data structure
+            page = []
             if 'data' in data:
                 if isinstance(data['data'], dict):
                     # For single-item endpoints like 'user'
-                    all_data.append(data['data'])
+                    page = [data['data']]
                 else:
                     # For collection endpoints
-                    all_data.extend(data['data'])
+                    page = data['data']
             
-            print(f"Current page data count: {len(data.get('data', []))}")
+            API_PAGES.inc(endpoint=endpoint)
+            total_items += len(page)
             
+            # next_url already carries the query string
             url = data.get('pages', {}).get('next_url')
-            if url:
-                print(f"Fetching next page for {endpoint}...")
+            params = None
+            meta['next_url'] = url
+            
+            # Drop the response before handing the page on so only one page is held at a time
+            del data
+            yield page
         
-        print(f"Total items fetched for {endpoint}: {len(all_data)}")
+        logger.info("Fetched %d %s records", total_items, endpoint)
+
+    def _checkpoint_path(self, endpoint):
+        return os.path.join(self.staging_dir, f"{endpoint}.checkpoint.json")
+
+    def _load_checkpoint(self, endpoint, query):
+        """Cursor of an interrupted download of the same query, if it is recent enough to resume"""
+        path = self._checkpoint_path(endpoint)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        age = datetime.now() - datetime.fromisoformat(checkpoint['started_at'])
+        pages_path = checkpoint['pages_path']
+        if checkpoint['query'] != query or age > self.cache_duration or not os.path.exists(pages_path) \
+                or os.path.getsize(pages_path) < checkpoint['bytes']:
+            logger.info("Discarding the %s checkpoint; it does not match this download", endpoint)
+            self._clear_checkpoint(endpoint)
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, endpoint, checkpoint):
+        path = self._checkpoint_path(endpoint)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def _clear_checkpoint(self, endpoint):
+        """Forget an endpoint's download cursor and any pages it still points at"""
+        path = self._checkpoint_path(endpoint)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            pages_path = json.load(f)['pages_path']
+        for stale_path in [pages_path, path]:
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    def _download_pages(self, endpoint, params=None, conditional_headers=None, meta=None):
+        """Append every page of a collection to a staging file, saving the cursor after each page.
+
+        When an earlier download of the same query stopped partway (a timeout, a 429 that outlasted the
+        retries), this resumes from the page after the last one saved instead of starting over.
+        Returns the staging file path and the number of records in it.
+        """
+        if meta is None:
+            meta = {}
+        pages_path = os.path.join(self.staging_dir, f"{endpoint}.pages.ndjson")
+        query = {'params': params}
+        checkpoint = self._load_checkpoint(endpoint, query)
+        if checkpoint:
+            meta.update(checkpoint['meta'])
+            if checkpoint['next_url'] is None:
+                # Every page arrived, but the snapshot was never saved
+                meta['not_modified'] = False
+                return pages_path, checkpoint['records']
+            # Bytes past the checkpoint belong to a page that was not finished
+            os.truncate(pages_path, checkpoint['bytes'])
+            logger.info("Resuming %s from page %d, %d records already saved", endpoint, checkpoint['pages'] + 1,
+                        checkpoint['records'])
+            start_url, mode = checkpoint['next_url'], 'a'
+        else:
+            checkpoint = {'query': query, 'pages_path': pages_path, 'started_at': datetime.now().isoformat(),
+                          'pages': 0, 'records': 0, 'bytes': 0, 'next_url': None, 'meta': {}}
+            start_url, mode = None, 'w'
+
+        try:
+            with open(pages_path, mode, encoding='utf-8') as f:
+                for page in self._iter_pages(endpoint, params, conditional_headers, meta, start_url=start_url):
+                    checkpoint['records'] += append_records(f, page)
+                    f.flush()
+                    checkpoint.update({
+                        'pages': checkpoint['pages'] + 1,
+                        'bytes': os.fstat(f.fileno()).st_size,
+                        'next_url': meta['next_url'],
+                        'meta': {key: meta[key] for key in ['etag', 'last_modified', 'data_updated_at']},
+                    })
+                    self._save_checkpoint(endpoint, checkpoint)
+        except Exception:
+            # Cataloged as partial, so it is never taken for a snapshot; the next fetch picks it up again
+            self.catalog.record('raw', endpoint, pages_path, row_count=checkpoint['records'], status='partial')
+            logger.warning("Fetching %s stopped after %d pages; the next fetch resumes from there",
+                           endpoint, checkpoint['pages'])
+            raise
+        return pages_path, checkpoint['records']
+
+    def _fetch_collection(self, endpoint, params=None, conditional_headers=None):
+        """Fetch every page of an endpoint into memory, returning the records and response metadata"""
+        meta = {}
+        all_data = []
+        for page in self._iter_pages(endpoint, params, conditional_headers, meta):
+            all_data.extend(page)
+        return all_data, meta
+
+    def fetch_endpoint(self, endpoint, params=None, force_refresh=False):
+        """Fetch data from a WaniKani endpoint with pagination handling"""
+        all_data, _ = self._fetch_collection(endpoint, params)
         return all_data
 
+    def _merge_records(self, existing, changes):
+        """Stream existing records, replacing those whose id appears in changes and appending new ones"""
+        for record in existing:
+            yield changes.pop(record['id'], record)
+        yield from changes.values()
+
+    def sync_endpoint(self, endpoint, out_path, params=None):
+        """Stream records changed since the last successful sync, merged by id, into out_path"""
+        endpoint_state = self._load_sync_state().get(endpoint, {})
+        updated_after = endpoint_state.get('updated_after')
+        latest = self.catalog.latest('raw', endpoint)
+        latest_raw = latest['path'] if latest and os.path.exists(latest['path']) else None
+        meta = {}
+        
+        # Without a previous sync point or snapshot there is nothing to merge into
+        if not updated_after or not latest_raw:
+            logger.info("No previous sync for %s, fetching full collection", endpoint)
+            pages_path, count = self._download_pages(endpoint, params, meta=meta)
+            os.replace(pages_path, out_path)
+            return self._next_sync_state(endpoint_state, meta, updated_after), count
+        
+        params = dict(params or {})
+        params['updated_after'] = updated_after
+        conditional_headers = {}
+        if endpoint_state.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = endpoint_state['last_modified']
+        # An ETag is only comparable when the query is identical to the one it was issued for
+        if endpoint_state.get('etag') and endpoint_state.get('etag_updated_after') == updated_after:
+            conditional_headers['If-None-Match'] = endpoint_state['etag']
+        
+        logger.info("Syncing %s changes since %s", endpoint, updated_after)
+        # Only the changed records are held in memory; the cached snapshot is streamed through
+        pages_path, _ = self._download_pages(endpoint, params, conditional_headers, meta)
+        changes = {record['id']: record for record in iter_records(pages_path)}
+        
+        logger.info("Merging %d changed records into cached %s", len(changes), endpoint)
+        
+        with open(out_path, 'w', encoding='utf-8') as f:
+            count = append_records(f, self._merge_records(iter_records(latest_raw), changes))
+        
+        return self._next_sync_state(endpoint_state, meta, updated_after), count
+
+    def _next_sync_state(self, endpoint_state, meta, updated_after):
+        """Build the sync state to store after a successful fetch"""
+        if meta['not_modified']:
+            next_state = dict(endpoint_state)
+        else:
+            next_updated_after = meta['data_updated_at'] or updated_after
+            next_state = {
+                'updated_after': next_updated_after,
+                'etag': meta['etag'],
+                'etag_updated_after': updated_after,
+                'last_modified': meta['last_modified'] or endpoint_state.get('last_modified'),
+            }
+        next_state['synced_at'] = datetime.now().isoformat()
+        return next_state
+
     def save_raw_data(self, data, endpoint):
-        """Save raw JSON data with timestamp"""
+        """Save raw records as NDJSON with timestamp"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{endpoint}_{timestamp}.json"
+        filename = f"{endpoint}_{timestamp}.ndjson"
         filepath = os.path.join(self.raw_data_dir, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_records(filepath, data)
         return filepath
 
-    def fetch_and_save(self, endpoint, params=None, force_refresh=False):
-        """Fetch data and save it both as raw JSON and processed CSV"""
+    def save_processed_data(self, raw_filepath, endpoint):
+        """Build the processed table from a raw snapshot in bounded-size chunks"""
+        filename = f"{endpoint}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{self.storage.extension}"
+        filepath = os.path.join(self.processed_data_dir, filename)
+        
+        def frames():
+            columns = None
+            for chunk in iter_record_chunks(raw_filepath, self.chunk_size):
+                df = pd.DataFrame(chunk)
+                if columns is None:
+                    columns = df.columns
+                yield df.reindex(columns=columns)
+        
+        # Nothing is written for an empty snapshot
+        rows = self.storage.write_chunks(filepath, frames())
+        return filepath if rows else None
+
+    def fetch_and_save(self, endpoint, params=None, force_refresh=False, incremental=None):
+        """Stream data to a raw NDJSON snapshot and build the processed table from it"""
+        if incremental is None:
+            incremental = self.incremental
+        
         # Check for cached data
-        latest_raw = self._get_latest_file(self.raw_data_dir, f"{endpoint}_")
-        latest_csv = self._get_latest_file(self.processed_data_dir, f"{endpoint}_")
+        latest_raw = self.catalog.latest('raw', endpoint)
         
-        if not force_refresh and self._is_cache_valid(latest_raw):
-            print(f"Using cached data for {endpoint}")
-            with open(latest_raw, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
+        fresh = not force_refresh and self.catalog.is_fresh(latest_raw, self.cache_duration)
+        cache_result('raw_snapshot', fresh)
+        if fresh:
+            logger.info("Using cached data for %s", endpoint)
+            return latest_raw['path']
         
-        print(f"Fetching {endpoint}...")
-        data = self.fetch_endpoint(endpoint, params)
+        logger.info("Fetching %s", endpoint)
+        # Pages are written to a staging file as they arrive and only moved into place when complete
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        staging_path = os.path.join(self.staging_dir, f"{endpoint}_{timestamp}.ndjson")
+        with stage_timer('download', endpoint=endpoint):
+            if incremental:
+                sync_state, count = self.sync_endpoint(endpoint, staging_path, params)
+            else:
+                meta = {}
+                pages_path, count = self._download_pages(endpoint, params, meta=meta)
+                os.replace(pages_path, staging_path)
+                sync_state = self._next_sync_state({}, meta, None)
         
         # Archive old files before saving new ones
         self._archive_old_files(endpoint)
         
         # Save raw data
-        raw_filepath = self.save_raw_data(data, endpoint)
-        print(f"Saved raw data to {raw_filepath}")
+        raw_filepath = os.path.join(self.raw_data_dir, os.path.basename(staging_path))
+        os.replace(staging_path, raw_filepath)
+        raw_hash = file_hash(raw_filepath)
+        self.catalog.record('raw', endpoint, raw_filepath, content_hash=raw_hash, row_count=count)
+        ROWS_PROCESSED.inc(count, layer='raw', endpoint=endpoint)
+        logger.info("Saved %d raw records to %s", count, raw_filepath)
+        
+        # Build the processed table from the snapshot on disk, unless the content is unchanged
+        up_to_date = self.catalog.derived_from('processed', endpoint, raw_hash) is not None
+        cache_result('processed', up_to_date)
+        if up_to_date:
+            logger.info("Processed data for %s is already up to date", endpoint)
+        else:
+            with stage_timer('processed', endpoint=endpoint):
+                processed_filepath = self.save_processed_data(raw_filepath, endpoint)
+            if processed_filepath:
+                self.catalog.record('processed', endpoint, processed_filepath, row_count=count,
+                                    source_path=raw_filepath, source_hash=raw_hash)
+                ROWS_PROCESSED.inc(count, layer='processed', endpoint=endpoint)
+                logger.info("Saved processed data to %s", processed_filepath)
         
-        # Convert to DataFrame and save as CSV
-        df = pd.DataFrame(data)
-        if not df.empty:
-            csv_filename = f"{endpoint}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            csv_filepath = os.path.join(self.processed_data_dir, csv_filename)
-            df.to_csv(csv_filepath, index=False)
-            print(f"Saved processed data to {csv_filepath}")
+        # Only advance the sync point once the snapshot is safely on disk
+        self._save_sync_state(endpoint, sync_state)
+        self._clear_checkpoint(endpoint)
+        self.catalog.set_status(os.path.join(self.staging_dir, f"{endpoint}.pages.ndjson"), 'completed')
         
-        return data
+        return raw_filepath
 
-    def fetch_all_data(self, force_refresh=False):
+    def fetch_all_data(self, force_refresh=False, incremental=None, endpoints=None):
         """Fetch all relevant WaniKani data"""
-        endpoints = [
-            'subjects',
-            'assignments',
-            'level_progressions',
-            'review_statistics',
-            'spaced_repetition_systems'
-        ]
-        
-        for endpoint in endpoints:
-            try:
-                self.fetch_and_save(endpoint, force_refresh=force_refresh)
-            except Exception as e:
-                print(f"Error fetching {endpoint}: {str(e)}")
+        if endpoints is None:
+            endpoints = ALL_ENDPOINTS
+        
+        # Endpoints are fetched concurrently; the scheduler keeps the total under the rate limit
+        tasks = {
+            endpoint: (lambda endpoint=endpoint: self.fetch_and_save(endpoint, force_refresh=force_refresh, incremental=incremental))
+            for endpoint in endpoints
+        }
+        results = self.scheduler.run(tasks)
+        
+        for endpoint, result in results.items():
+            if isinstance(result, Exception):
+                logger.error("Error fetching %s: %s", endpoint, result, exc_info=result)
 
 if __name__ == "__main__":
+    configure_logging()
     fetcher = WaniKaniDataFetcher(cache_duration_hours=168)  # 1 week cache
     fetcher.fetch_all_data() 
\ No newline at end of file
@@ -1,69 +1,74 @@
 import pandas as pd
-import json
+import logging
 import os
-import shutil
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from ndjson_store import iter_record_chunks, iter_records
+from storage import get_storage, read_frame
+from snapshot_catalog import SnapshotCatalog, file_hash, parse_snapshot_filename
+from fact_table import LearnerFacts
+from flattening import child_table_names, flatten_byte_range, flatten_records, has_schema, split_line_ranges
+from metrics import ROWS_PROCESSED, cache_result, stage_timer
+from config import configure_logging
+
+logger = logging.getLogger(__name__)
 
 class WaniKaniDataProcessor:
-    def __init__(self, cache_duration_hours=168):  # 1 week cache
-        self.raw_data_dir = "data/raw"
-        self.processed_data_dir = "data/processed"
-        self.curated_data_dir = "data/curated"
-        self.archive_dir = "data/archive"
+    def __init__(self, cache_duration_hours=168, chunk_size=5000, storage_format=None, catalog=None,
+                 max_workers=None, chunk_bytes=8 * 1024 * 1024, data_root="data", frame_cache=None):  # 1 week cache
+        self.data_root = data_root  # Per-account directory when serving many users
+        self.raw_data_dir = os.path.join(data_root, "raw")
+        self.processed_data_dir = os.path.join(data_root, "processed")
+        self.curated_data_dir = os.path.join(data_root, "curated")
+        self.frame_cache = frame_cache  # Optional in-memory LRU of loaded curated tables
         self.cache_duration = timedelta(hours=cache_duration_hours)
+        self.chunk_size = chunk_size  # Records per chunk when curating a snapshot
+        self.storage = get_storage(storage_format)  # Columnar by default, CSV on request
+        self.max_workers = max_workers or os.cpu_count() or 1  # Processes used for flattening
+        self.chunk_bytes = chunk_bytes  # Size of the NDJSON slices handed to each worker
         
         # Create directories if they don't exist
         os.makedirs(self.curated_data_dir, exist_ok=True)
-        os.makedirs(self.archive_dir, exist_ok=True)
-
-    def _get_latest_file(self, directory, prefix):
-        """Get the most recent file for a given endpoint"""
-        files = [f for f in os.listdir(directory) if f.startswith(prefix)]
-        if not files:
-            return None
-        
-        # Sort by timestamp in filename (newest first)
-        latest_file = sorted(files, reverse=True)[0]
-        return os.path.join(directory, latest_file)
-
-    def _is_cache_valid(self, filepath):
-        """Check if the cached file is still valid"""
-        if not filepath or not os.path.exists(filepath):
-            return False
-        
-        # Extract timestamp from filename (format: curated_XXXX_YYYYMMDD_HHMMSS)
-        filename = os.path.basename(filepath)
-        timestamp_str = filename.split('_')[-2] + '_' + filename.split('_')[-1].split('.')[0]
-        file_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-        
-        # Check if file is older than cache duration
-        return datetime.now() - file_time < self.cache_duration
-
-    def _archive_old_files(self, prefix):
-        """Archive files older than cache duration for a given prefix"""
-        current_time = datetime.now()
-        
-        # Get all files with the given prefix
-        files = [f for f in os.listdir(self.curated_data_dir) if f.startswith(prefix)]
-        for file in files:
-            filepath = os.path.join(self.curated_data_dir, file)
-            # Extract timestamp (format: curated_XXXX_YYYYMMDD_HHMMSS)
-            timestamp_str = file.split('_')[-2] + '_' + file.split('_')[-1].split('.')[0]
-            file_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-            
-            if current_time - file_time >= self.cache_duration:
-                # Create archive subdirectory if it doesn't exist
-                archive_subdir = os.path.join(self.archive_dir, prefix)
-                os.makedirs(archive_subdir, exist_ok=True)
-                
-                # Move file to archive
-                shutil.move(filepath, os.path.join(archive_subdir, file))
-                print(f"Archived {file} to {archive_subdir}")
+        
+        # Snapshot lookups go through the catalog instead of scanning directories
+        self.catalog = catalog or SnapshotCatalog(os.path.join(data_root, "catalog.sqlite"))
+        if not self.catalog.has_layer('curated'):
+            self.catalog.import_directory('raw', self.raw_data_dir)
+            self.catalog.import_directory('curated', self.curated_data_dir, strip_prefix='curated_')
+
+    def _archive_old_files(self, endpoint):
+        """Drop curated tables older than cache duration; the raw archive can rebuild any of them"""
+        for table_name in [endpoint] + child_table_names(endpoint):
+            for entry in self.catalog.expired('curated', table_name, self.cache_duration):
+                if os.path.exists(entry['path']):
+                    os.remove(entry['path'])
+                self.catalog.set_status(entry['path'], 'deleted')
 
     def load_json_file(self, filepath):
-        """Load JSON file and return as list of dictionaries"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """Load a raw snapshot (NDJSON or legacy JSON) and return as list of dictionaries"""
+        return list(iter_records(filepath))
+
+    def _collect_nested_keys(self, value, prefix, columns):
+        """Record the dotted column names json_normalize would produce for a nested dict"""
+        for key, item in value.items():
+            name = f"{prefix}{key}"
+            if isinstance(item, dict):
+                self._collect_nested_keys(item, f"{name}.", columns)
+            else:
+                columns.setdefault(name)
+
+    def collect_columns(self, filepath):
+        """Scan a snapshot once to find every column the expanded output will have"""
+        top_columns = {}
+        data_columns = {}
+        for record in iter_records(filepath):
+            for key in record:
+                if key != 'data':
+                    top_columns.setdefault(key)
+            if isinstance(record.get('data'), dict):
+                self._collect_nested_keys(record['data'], '', data_columns)
+        return list(top_columns) + list(data_columns)
 
     def expand_data_column(self, data_list):
         """Expand the nested 'data' column into separate columns"""
@@ -81,42 +86,151 @@ class WaniKaniDataProcessor:
         
         return result_df
 
-    def process_file(self, filename):
-        """Process a single JSON file and save both raw and processed versions"""
-        # Check for cached curated file
-        prefix = f"curated_{filename.replace('.json', '')}"
-        latest_curated = self._get_latest_file(self.curated_data_dir, prefix)
-        
-        if self._is_cache_valid(latest_curated):
-            print(f"Using cached curated data for {filename}")
-            return pd.read_csv(latest_curated)
-        
-        # Load the JSON file
+    def convert_timestamps(self, df):
+        """Parse WaniKani timestamp columns (*_at) once so they are stored typed"""
+        for column in df.columns:
+            if column.split('.')[-1].endswith('_at'):
+                df[column] = pd.to_datetime(df[column], utc=True, errors='coerce')
+        return df
+
+    def _raw_entry(self, filename):
+        """Catalog entry for a raw snapshot, registering files the catalog has not seen yet"""
         filepath = os.path.join(self.raw_data_dir, filename)
-        data = self.load_json_file(filepath)
-        
-        # Expand the data
-        expanded_df = self.expand_data_column(data)
+        entry = self.catalog.get(filepath)
+        if entry:
+            return entry
+        endpoint, timestamp = parse_snapshot_filename(filename)
+        return self.catalog.record('raw', endpoint, filepath, content_hash=file_hash(filepath), created_at=timestamp)
+
+    def process_file(self, filename):
+        """Curate a single raw snapshot in bounded-size chunks, returning the curated file path"""
+        return self.process_snapshot(self._raw_entry(filename))
+
+    def process_snapshot(self, entry, pool=None):
+        """Curate a cataloged raw snapshot unless a curated build of the same content already exists"""
+        endpoint = entry['endpoint']
+        filepath = entry['path']
+        
+        # Check for a curated file built from identical raw content
+        cached = self.catalog.derived_from('curated', endpoint, entry['content_hash'])
+        cache_result('curated', bool(cached and os.path.exists(cached['path'])))
+        if cached and os.path.exists(cached['path']):
+            logger.info("Using cached curated data for %s", os.path.basename(filepath))
+            return cached['path']
         
         # Archive old files before saving new ones
-        self._archive_old_files(prefix)
+        self._archive_old_files(endpoint)
+        
+        if has_schema(endpoint):
+            return self._process_with_schema(entry, pool)
         
         # Save processed data
-        output_filename = f"{prefix}.csv"
+        prefix = f"curated_{os.path.splitext(os.path.basename(filepath))[0]}"
+        output_filename = f"{prefix}{self.storage.extension}"
         output_path = os.path.join(self.curated_data_dir, output_filename)
         
-        expanded_df.to_csv(output_path, index=False)
-        print(f"Processed data saved to: {output_path}")
+        # Chunks can expose different nested keys, so fix the column set up front
+        columns = self.collect_columns(filepath)
+        
+        def frames():
+            # Expand the data one chunk at a time
+            for chunk in iter_record_chunks(filepath, self.chunk_size):
+                yield self.convert_timestamps(self.expand_data_column(chunk).reindex(columns=columns))
+        
+        with stage_timer('curate', endpoint=endpoint):
+            rows = self.storage.write_chunks(output_path, frames())
+        self.catalog.record('curated', endpoint, output_path, row_count=rows,
+                            source_path=filepath, source_hash=entry['content_hash'])
+        ROWS_PROCESSED.inc(rows, layer='curated', endpoint=endpoint)
+        logger.info("Processed %d rows, saved to: %s", rows, output_path)
         
-        return expanded_df
+        return output_path
+
+    def _flattened_chunks(self, endpoint, filepath, pool):
+        """Yield flattened tables chunk by chunk in file order, keeping a bounded number in flight"""
+        if filepath.endswith('.json'):
+            # Legacy JSON arrays cannot be split by byte offset
+            for chunk in iter_record_chunks(filepath, self.chunk_size):
+                yield flatten_records(endpoint, chunk)
+            return
+        
+        ranges = split_line_ranges(filepath, self.chunk_bytes)
+        if pool is None or len(ranges) == 1:
+            for start, end in ranges:
+                yield flatten_byte_range(endpoint, filepath, start, end)
+            return
+        
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(flatten_byte_range, endpoint, filepath, start, end))
+            if len(pending) >= self.max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _process_with_schema(self, entry, pool=None):
+        """Curate a snapshot into a typed main table plus child tables for its nested arrays"""
+        endpoint = entry['endpoint']
+        filepath = entry['path']
+        # Output names keep the raw snapshot's timestamp, e.g. curated_subjects_meanings_YYYYMMDD_HHMMSS
+        suffix = os.path.splitext(os.path.basename(filepath))[0][len(endpoint):]
+        
+        writers = {}
+        # Every table's column types come from the endpoint schema, not from whichever chunk is first
+        templates = flatten_records(endpoint, [])
+        with stage_timer('curate', endpoint=endpoint):
+            for tables in self._flattened_chunks(endpoint, filepath, pool):
+                for table_name, frame in tables.items():
+                    if table_name not in writers:
+                        output_path = os.path.join(self.curated_data_dir, f"curated_{table_name}{suffix}{self.storage.extension}")
+                        writers[table_name] = (output_path, self.storage.open_writer(output_path, templates[table_name]))
+                    writers[table_name][1].write(frame)
+            
+            for table_name, (output_path, writer) in writers.items():
+                rows = writer.close()
+                self.catalog.record('curated', table_name, output_path, row_count=rows,
+                                    source_path=filepath, source_hash=entry['content_hash'])
+                ROWS_PROCESSED.inc(rows, layer='curated', endpoint=table_name)
+                logger.info("Processed %d rows, saved to: %s", rows, output_path)
+        
+        return writers[endpoint][0] if endpoint in writers else None
+
+    def load_curated(self, endpoint, columns=None, memory_map=True):
+        """Load the latest curated table for an endpoint, optionally only some columns"""
+        latest_curated = self.catalog.latest('curated', endpoint)
+        if not latest_curated:
+            raise FileNotFoundError(f"No curated data found for {endpoint}")
+        if self.frame_cache is None:
+            return read_frame(latest_curated['path'], columns=columns, memory_map=memory_map)
+        
+        # Snapshot paths are unique per build, so a new curated file never hits a stale entry
+        key = (latest_curated['path'], tuple(columns) if columns else None)
+        return self.frame_cache.get_or_load(
+            key, lambda: read_frame(latest_curated['path'], columns=columns, memory_map=memory_map))
+
+    def learner_facts(self, subject_catalog=None):
+        """The account's joined subject/assignment/review statistics table, brought up to date"""
+        facts = LearnerFacts(self, subject_catalog)
+        facts.refresh()
+        return facts
 
     def process_all_files(self):
-        """Process all JSON files in the raw data directory"""
-        for filename in os.listdir(self.raw_data_dir):
-            if filename.endswith('.json'):
-                print(f"Processing {filename}...")
-                self.process_file(filename)
+        """Curate the latest raw snapshot of every endpoint, skipping unchanged content"""
+        # Chunks from every file share one process pool
+        pool = ProcessPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        # Interrupted downloads are cataloged as partial, never active, so only complete snapshots are curated
+        for entry in self.catalog.partial('raw'):
+            logger.warning("Not curating the unfinished %s download (%s records so far)", entry['endpoint'], entry['row_count'])
+        try:
+            for entry in self.catalog.latest_per_endpoint('raw'):
+                logger.info("Processing %s", os.path.basename(entry['path']))
+                self.process_snapshot(entry, pool)
+        finally:
+            if pool:
+                pool.shutdown()
 
 if __name__ == "__main__":
+    configure_logging()
     processor = WaniKaniDataProcessor(cache_duration_hours=168)  # 1 week cache
-    processor.process_all_files() 
\ No newline at end of file
+    processor.process_all_files()
+    processor.learner_facts()
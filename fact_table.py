@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from metrics import ROWS_PROCESSED, stage_timer
+
+logger = logging.getLogger(__name__)
+
+SRS_STAGES = list(range(10))  # 0 = lesson queue ... 9 = burned
+
+# Columns each account endpoint contributes to the fact table: curated column -> fact column
+SOURCE_COLUMNS = {
+    'assignments': {
+        'id': 'assignment_id',
+        'srs_stage': 'srs_stage',
+        'unlocked_at': 'unlocked_at',
+        'started_at': 'started_at',
+        'passed_at': 'passed_at',
+        'burned_at': 'burned_at',
+        'available_at': 'available_at',
+    },
+    'review_statistics': {
+        'meaning_correct': 'meaning_correct',
+        'meaning_incorrect': 'meaning_incorrect',
+        'meaning_current_streak': 'meaning_current_streak',
+        'reading_correct': 'reading_correct',
+        'reading_incorrect': 'reading_incorrect',
+        'reading_current_streak': 'reading_current_streak',
+        'percentage_correct': 'percentage_correct',
+    },
+}
+SUBJECT_COLUMNS = ['level', 'subject_type', 'spaced_repetition_system_id', 'hidden']
+SOURCES = ['subjects'] + list(SOURCE_COLUMNS)
+
+def downcast_integers(series):
+    """Smallest nullable integer dtype that holds every value of a column"""
+    values = series.dropna()
+    for dtype in ['Int8', 'Int16', 'Int32']:
+        info = np.iinfo(dtype.lower())
+        if values.empty or (values.min() >= info.min and values.max() <= info.max):
+            return series.astype(dtype)
+    return series.astype('Int64')
+
+def answer_totals(frame):
+    """Correct and total answers per row, widened to int64 first; the stored counts are too narrow to add up"""
+    counts = {column: frame[column].fillna(0).astype('int64')
+              for column in ['meaning_correct', 'reading_correct', 'meaning_incorrect', 'reading_incorrect']}
+    correct = counts['meaning_correct'] + counts['reading_correct']
+    return correct, correct + counts['meaning_incorrect'] + counts['reading_incorrect']
+
+def _restore_dtypes(frame):
+    """Compact dtypes for every fact column; CSV storage loses them, Parquet keeps them"""
+    frame.index = frame.index.astype('int32')
+    frame.index.name = 'subject_id'
+    frame['level'] = frame['level'].astype('Int8')
+    frame['subject_type'] = frame['subject_type'].astype('category')
+    frame['spaced_repetition_system_id'] = frame['spaced_repetition_system_id'].astype('Int8')
+    frame['hidden'] = frame['hidden'].astype('boolean')
+    if 'srs_stage' in frame:
+        stages = pd.to_numeric(frame['srs_stage'].astype('object'), errors='coerce')
+        frame['srs_stage'] = pd.Categorical(stages, categories=SRS_STAGES, ordered=True)
+    for column in frame.columns:
+        if column.endswith('_at'):
+            frame[column] = pd.to_datetime(frame[column], utc=True, errors='coerce')
+        elif column == 'assignment_id' or column in SOURCE_COLUMNS['review_statistics'].values():
+            frame[column] = downcast_integers(pd.to_numeric(frame[column], errors='coerce'))
+    return frame
+
+class LearnerFacts:
+    """One row per subject joining the curriculum with an account's assignments and review statistics.
+
+    Rows are ordered by level, then subject id, so a level is a contiguous slice found through level_bounds.
+    The table is saved next to the curated layer with the version of each source it was built from; when
+    only one endpoint changed, only that endpoint's columns are rebuilt.
+    """
+    def __init__(self, processor, subject_catalog=None):
+        self.processor = processor
+        self.subject_catalog = subject_catalog  # Shared subject index; falls back to the account's own subjects
+        self.storage = processor.storage
+        self.manifest_path = os.path.join(processor.curated_data_dir, "learner_facts.json")
+        self.frame = None
+        self.versions = {}  # Source endpoint -> version the current frame was built from
+        self.level_bounds = {}  # Level -> (first row, end row)
+
+    def source_versions(self):
+        """Current version of every source, or None for a source that has not been curated"""
+        versions = {}
+        for endpoint in SOURCES:
+            if endpoint == 'subjects' and self.subject_catalog is not None and self.subject_catalog.version:
+                versions[endpoint] = self.subject_catalog.version
+                continue
+            curated = self.processor.catalog.latest('curated', endpoint)
+            versions[endpoint] = curated['source_hash'] if curated else None
+        return versions
+
+    def _load_subjects(self):
+        """Subject id -> level, type, SRS system and hidden flag"""
+        if self.subject_catalog is not None and self.subject_catalog.index is not None:
+            index = self.subject_catalog.index
+            subjects = pd.DataFrame({
+                'level': index['level'],
+                'subject_type': index['type'],
+                'spaced_repetition_system_id': index.get('spaced_repetition_system_id', pd.Series(pd.NA, index=index.index)),
+                'hidden': index['hidden'],
+            })
+        else:
+            subjects = self.processor.load_curated(
+                'subjects', columns=['id', 'object', 'level', 'spaced_repetition_system_id', 'hidden_at'])
+            subjects = subjects.rename(columns={'object': 'subject_type'}).set_index('id')
+            subjects['hidden'] = subjects.pop('hidden_at').notna()
+        return subjects[SUBJECT_COLUMNS]
+
+    def _load_source(self, endpoint, subject_ids):
+        """An endpoint's fact columns aligned to subject_ids; subjects without a record get missing values"""
+        columns = SOURCE_COLUMNS[endpoint]
+        try:
+            table = self.processor.load_curated(endpoint, columns=['subject_id'] + list(columns))
+        except FileNotFoundError:
+            return pd.DataFrame(index=subject_ids, columns=list(columns.values()))
+        table = table.dropna(subset=['subject_id']).drop_duplicates('subject_id', keep='last')
+        table = table.set_index('subject_id').rename(columns=columns)
+        table.index = table.index.astype('int32')
+        return table.reindex(subject_ids)
+
+    def _index_levels(self):
+        """Rebuild the level -> row slice lookup from the level-sorted frame"""
+        levels = self.frame['level'].to_numpy(dtype='float64', na_value=np.nan)
+        present = np.unique(levels[~np.isnan(levels)])
+        starts = np.searchsorted(levels, present, side='left')
+        ends = np.searchsorted(levels, present, side='right')
+        self.level_bounds = {int(level): (int(start), int(end)) for level, start, end in zip(present, starts, ends)}
+
+    def build(self):
+        """Build the whole table from the current version of every source"""
+        subjects = self._load_subjects()
+        subjects.index = subjects.index.astype('int32')
+        subjects = subjects.reset_index(names='subject_id').sort_values(['level', 'subject_id']).set_index('subject_id')
+        frames = [subjects] + [self._load_source(endpoint, subjects.index) for endpoint in SOURCE_COLUMNS]
+        self.frame = _restore_dtypes(pd.concat(frames, axis=1))
+        self._index_levels()
+
+    def update(self, endpoint):
+        """Replace the columns of one changed account endpoint, keeping every other column as it is"""
+        if endpoint not in SOURCE_COLUMNS or self.frame is None:
+            # A new curriculum changes the rows themselves
+            self.build()
+            return
+        source = self._load_source(endpoint, self.frame.index)
+        for column in source.columns:
+            self.frame[column] = source[column]
+        self.frame = _restore_dtypes(self.frame)
+
+    def _load_saved(self):
+        """The saved table and the versions it was built from, if one exists"""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not os.path.exists(manifest['path']):
+            return
+        path = manifest['path']
+        frame_cache = self.processor.frame_cache
+        if frame_cache is None:
+            frame = self.storage.read(path, memory_map=True)
+        else:
+            frame = frame_cache.get_or_load((path, None), lambda: self.storage.read(path, memory_map=True))
+        self.frame = _restore_dtypes(frame.set_index('subject_id'))
+        self.versions = manifest['versions']
+        self._index_levels()
+
+    def _save(self):
+        """Write the table under a new name and point the manifest at it, removing the previous file"""
+        previous = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)['path']
+        digest = '_'.join((self.versions[endpoint] or 'none')[:8] for endpoint in SOURCES)
+        path = os.path.join(self.processor.curated_data_dir, f"learner_facts_{digest}{self.storage.extension}")
+        frame = self.frame.reset_index()
+        rows = self.storage.write_chunks(path, [frame], template=frame.iloc[:0])
+        tmp_path = self.manifest_path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'versions': self.versions, 'rows': rows}, f)
+        os.replace(tmp_path, self.manifest_path)
+        if previous and previous != path and os.path.exists(previous):
+            os.remove(previous)
+        ROWS_PROCESSED.inc(rows, layer='facts', endpoint='learner_facts')
+
+    def refresh(self):
+        """Bring the table up to date with its sources, rebuilding only the parts that changed"""
+        versions = self.source_versions()
+        if self.frame is None:
+            self._load_saved()
+        if self.frame is not None and versions == self.versions:
+            return self.frame
+
+        changed = [endpoint for endpoint in SOURCES if versions[endpoint] != self.versions.get(endpoint)]
+        with stage_timer('facts'):
+            if self.frame is None or 'subjects' in changed:
+                logger.info("Building learner fact table")
+                self.build()
+            else:
+                for endpoint in changed:
+                    logger.info("Updating learner fact table for new %s", endpoint)
+                    self.update(endpoint)
+            self.versions = versions
+            self._save()
+        return self.frame
+
+    def by_level(self, level):
+        """Rows of one level, as a slice of the level-sorted table"""
+        start, end = self.level_bounds.get(int(level), (0, 0))
+        return self.frame.iloc[start:end]
+
+    def by_subject(self, subject_ids):
+        """Rows for a sequence of subject ids, in the same order"""
+        return self.frame.reindex(subject_ids)
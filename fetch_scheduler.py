@@ -0,0 +1,116 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import API_BYTES, API_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# WaniKani allows 60 requests per minute per API token; override only against a local stand-in
+WANIKANI_REQUESTS_PER_MINUTE = int(os.getenv('WANIKANI_REQUESTS_PER_MINUTE', '60'))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    def __init__(self, requests_per_minute=WANIKANI_REQUESTS_PER_MINUTE, burst=5):
+        # A full bucket plus one minute of refill must stay within the per-minute budget,
+        # so the burst is taken out of the refill rate rather than added on top of it
+        burst = max(1, min(burst, requests_per_minute // 2))
+        self.rate = (requests_per_minute - burst) / 60.0  # Tokens added per second
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request token is available"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Drain the bucket so every caller waits at least the given number of seconds"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class FetchScheduler:
+    def __init__(self, requests_per_minute=WANIKANI_REQUESTS_PER_MINUTE, max_workers=4,
+                 max_retries=5, backoff_base=1.0, timeout=30):
+        self.limiter = TokenBucket(requests_per_minute)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+
+        # Pooled keep-alive connections shared by all worker threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _retry_delay(self, response, attempt):
+        """Work out how long to wait before retrying a failed request"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+            # WaniKani reports when the current rate limit window resets (epoch seconds)
+            reset = response.headers.get('RateLimit-Reset')
+            if response.status_code == 429 and reset and reset.isdigit():
+                return max(float(reset) - time.time(), 1.0)
+        # Exponential backoff with jitter, capped at one minute
+        return min(self.backoff_base * 2 ** attempt, 60.0) + random.uniform(0, self.backoff_base)
+
+    def get(self, url, headers=None, params=None):
+        """Rate-limited GET that retries on 429, 5xx and connection errors"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                API_REQUESTS.inc(status='error')
+                delay = self._retry_delay(None, attempt)
+                logger.warning("Request to %s failed (%s), retrying in %.1fs", url, e, delay)
+                time.sleep(delay)
+                continue
+
+            API_REQUESTS.inc(status=response.status_code)
+            API_BYTES.inc(len(response.content))
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            delay = self._retry_delay(response, attempt)
+            if response.status_code == 429:
+                # Hold back every worker, not just this one
+                self.limiter.pause(delay)
+            logger.warning("Got HTTP %s from %s, retrying in %.1fs", response.status_code, url, delay)
+            time.sleep(delay)
+
+    def run(self, tasks):
+        """Run named callables concurrently, returning a dict of results or raised exceptions"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(task) for name, task in tasks.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = e
+        return results
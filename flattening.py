@@ -0,0 +1,189 @@
+import json
+import os
+import pandas as pd
+
+# Columns shared by every WaniKani resource
+RESOURCE_COLUMNS = {
+    'id': 'Int64',
+    'object': 'category',
+    'url': 'string',
+    'data_updated_at': 'datetime',
+}
+
+# Per-endpoint schemas: typed scalar columns taken from each record's 'data', plus nested
+# arrays that are split out into child tables. Object arrays list their fields; scalar
+# arrays name the single value column. Image and audio metadata are not curated.
+ENDPOINT_SCHEMAS = {
+    'subjects': {
+        'parent_key': 'subject_id',
+        'columns': {
+            'level': 'Int16',
+            'slug': 'string',
+            'characters': 'string',
+            'document_url': 'string',
+            'lesson_position': 'Int32',
+            'spaced_repetition_system_id': 'Int16',
+            'meaning_mnemonic': 'string',
+            'meaning_hint': 'string',
+            'reading_mnemonic': 'string',
+            'reading_hint': 'string',
+            'created_at': 'datetime',
+            'hidden_at': 'datetime',
+        },
+        'children': {
+            'meanings': {'meaning': 'string', 'primary': 'boolean', 'accepted_answer': 'boolean'},
+            'auxiliary_meanings': {'meaning': 'string', 'type': 'category'},
+            'readings': {'reading': 'string', 'primary': 'boolean', 'accepted_answer': 'boolean', 'type': 'category'},
+            'component_subject_ids': ('component_subject_id', 'Int32'),
+            'amalgamation_subject_ids': ('amalgamation_subject_id', 'Int32'),
+            'visually_similar_subject_ids': ('visually_similar_subject_id', 'Int32'),
+            'parts_of_speech': ('part_of_speech', 'category'),
+            'context_sentences': {'en': 'string', 'ja': 'string'},
+        },
+    },
+    'assignments': {
+        'columns': {
+            'subject_id': 'Int32',
+            'subject_type': 'category',
+            'srs_stage': 'Int8',
+            'hidden': 'boolean',
+            'created_at': 'datetime',
+            'unlocked_at': 'datetime',
+            'started_at': 'datetime',
+            'passed_at': 'datetime',
+            'burned_at': 'datetime',
+            'available_at': 'datetime',
+            'resurrected_at': 'datetime',
+        },
+    },
+    'level_progressions': {
+        'columns': {
+            'level': 'Int16',
+            'created_at': 'datetime',
+            'unlocked_at': 'datetime',
+            'started_at': 'datetime',
+            'passed_at': 'datetime',
+            'completed_at': 'datetime',
+            'abandoned_at': 'datetime',
+        },
+    },
+    'review_statistics': {
+        'columns': {
+            'subject_id': 'Int32',
+            'subject_type': 'category',
+            'meaning_correct': 'Int32',
+            'meaning_incorrect': 'Int32',
+            'meaning_max_streak': 'Int32',
+            'meaning_current_streak': 'Int32',
+            'reading_correct': 'Int32',
+            'reading_incorrect': 'Int32',
+            'reading_max_streak': 'Int32',
+            'reading_current_streak': 'Int32',
+            'percentage_correct': 'Int16',
+            'hidden': 'boolean',
+            'created_at': 'datetime',
+        },
+    },
+    'reviews': {
+        'columns': {
+            'assignment_id': 'Int64',
+            'subject_id': 'Int32',
+            'spaced_repetition_system_id': 'Int16',
+            'starting_srs_stage': 'Int8',
+            'ending_srs_stage': 'Int8',
+            'incorrect_meaning_answers': 'Int16',
+            'incorrect_reading_answers': 'Int16',
+            'created_at': 'datetime',
+        },
+    },
+    'spaced_repetition_systems': {
+        'parent_key': 'spaced_repetition_system_id',
+        'columns': {
+            'name': 'string',
+            'description': 'string',
+            'unlocking_stage_position': 'Int8',
+            'starting_stage_position': 'Int8',
+            'passing_stage_position': 'Int8',
+            'burning_stage_position': 'Int8',
+            'created_at': 'datetime',
+        },
+        'children': {
+            'stages': {'position': 'Int8', 'interval': 'Int64', 'interval_unit': 'category'},
+        },
+    },
+}
+
+def has_schema(endpoint):
+    """Whether the endpoint can be flattened with a typed schema"""
+    return endpoint in ENDPOINT_SCHEMAS
+
+def child_table_names(endpoint):
+    """Names of the child tables an endpoint is split into"""
+    return [f"{endpoint}_{child}" for child in ENDPOINT_SCHEMAS.get(endpoint, {}).get('children', {})]
+
+def _typed(values, dtype):
+    """Build a column of the given logical type directly from a list of values"""
+    if dtype == 'datetime':
+        return pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce')
+    if dtype == 'category':
+        return pd.Categorical(values)
+    return pd.array(values, dtype=dtype)
+
+def flatten_records(endpoint, records):
+    """Flatten a list of raw records into a typed main table plus one table per nested array"""
+    schema = ENDPOINT_SCHEMAS[endpoint]
+    data = [record.get('data') or {} for record in records]
+
+    columns = {name: _typed([record.get(name) for record in records], dtype)
+               for name, dtype in RESOURCE_COLUMNS.items()}
+    for name, dtype in schema['columns'].items():
+        columns[name] = _typed([item.get(name) for item in data], dtype)
+    tables = {endpoint: pd.DataFrame(columns)}
+
+    parent_key = schema.get('parent_key', 'parent_id')
+    for child, fields in schema.get('children', {}).items():
+        parent_ids = []
+        positions = []
+        scalar = isinstance(fields, tuple)
+        values = {fields[0]: []} if scalar else {field: [] for field in fields}
+        for record, item in zip(records, data):
+            for position, element in enumerate(item.get(child) or []):
+                parent_ids.append(record.get('id'))
+                positions.append(position)
+                if scalar:
+                    values[fields[0]].append(element)
+                else:
+                    for field in fields:
+                        values[field].append(element.get(field))
+
+        child_columns = {parent_key: _typed(parent_ids, 'Int64')}
+        # Array order is kept as 'position' unless the elements carry their own (e.g. SRS stages)
+        if scalar or 'position' not in fields:
+            child_columns['position'] = _typed(positions, 'Int16')
+        for field, field_values in values.items():
+            child_columns[field] = _typed(field_values, fields[1] if scalar else fields[field])
+        tables[f"{endpoint}_{child}"] = pd.DataFrame(child_columns)
+
+    return tables
+
+def flatten_byte_range(endpoint, filepath, start, end):
+    """Process-pool task: parse and flatten the NDJSON lines between two byte offsets"""
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+    records = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return flatten_records(endpoint, records)
+
+def split_line_ranges(filepath, chunk_bytes):
+    """Split an NDJSON file into (start, end) byte ranges that fall on line boundaries"""
+    size = os.path.getsize(filepath)
+    ranges = []
+    start = 0
+    with open(filepath, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()  # Move on to the end of the current line
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
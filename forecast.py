@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+INTERVAL_UNIT_SECONDS = {
+    'milliseconds': 0.001,
+    'seconds': 1,
+    'minutes': 60,
+    'hours': 3600,
+    'days': 86400,
+    'weeks': 604800,
+}
+
+# Pass chance for subject types without any review statistics yet
+DEFAULT_PASS_RATE = 0.85
+
+class SrsTable:
+    """Stage intervals and key positions of every spaced repetition system, as arrays indexed by system row"""
+    def __init__(self, systems, stages):
+        systems = systems.sort_values('id').reset_index(drop=True)
+        self.system_ids = systems['id'].to_numpy(dtype='int64')
+        self.starting = systems['starting_stage_position'].to_numpy(dtype='int64', na_value=1)
+        self.passing = systems['passing_stage_position'].to_numpy(dtype='int64', na_value=5)
+        self.burning = systems['burning_stage_position'].to_numpy(dtype='int64', na_value=9)
+
+        # intervals[system row, stage] in seconds; NaN where a stage has no next review (locked, burned)
+        self.intervals = np.full((len(systems), int(self.burning.max()) + 1), np.nan)
+        rows = pd.Index(self.system_ids).get_indexer(stages['spaced_repetition_system_id'].astype('int64'))
+        units = stages['interval_unit'].astype(object).map(INTERVAL_UNIT_SECONDS).astype('float64')
+        seconds = stages['interval'].astype('float64').to_numpy() * units.to_numpy()
+        positions = stages['position'].astype('int64').to_numpy()
+        known = (rows >= 0) & (positions < self.intervals.shape[1])
+        self.intervals[rows[known], positions[known]] = seconds[known]
+
+    def rows_for(self, system_ids, default_id):
+        """Row of each system id, falling back to default_id for unknown systems"""
+        index = pd.Index(self.system_ids)
+        rows = index.get_indexer(pd.Series(system_ids).fillna(default_id).astype('int64'))
+        default_row = index.get_loc(default_id) if default_id in index else 0
+        return np.where(rows >= 0, rows, default_row)
+
+def pass_rates(review_statistics):
+    """Chance of passing a review per subject type: the meaning and, where asked, the reading must both be right"""
+    stats = review_statistics
+    if 'hidden' in stats:
+        stats = stats[~stats['hidden'].fillna(False).astype(bool)]
+    totals = pd.DataFrame({
+        'subject_type': stats['subject_type'].astype(str),
+        'meaning_correct': stats['meaning_correct'].fillna(0),
+        'meaning_total': stats['meaning_correct'].fillna(0) + stats['meaning_incorrect'].fillna(0),
+        'reading_correct': stats['reading_correct'].fillna(0),
+        'reading_total': stats['reading_correct'].fillna(0) + stats['reading_incorrect'].fillna(0),
+    }).groupby('subject_type').sum()
+
+    meaning = (totals['meaning_correct'] / totals['meaning_total'].where(totals['meaning_total'] > 0)).fillna(DEFAULT_PASS_RATE)
+    # Radicals and kana vocabulary never ask for a reading
+    reading = (totals['reading_correct'] / totals['reading_total'].where(totals['reading_total'] > 0)).fillna(1.0)
+    return (meaning * reading).to_dict()
+
+def forecast_reviews(assignments, srs, rates, subject_systems=None, now=None, days=7, freq='h', runs=20, seed=0):
+    """Project review counts per hour ('h') or day ('D') over the next days.
+
+    Every assignment of every run is simulated at once as flat NumPy arrays: each wave reviews all items
+    that are due, draws pass/fail from the subject type's pass rate and schedules the next review from the
+    SRS intervals. A failed review drops one stage, or two from the passing stage up. Overdue reviews are
+    done now and every review is assumed to be done as soon as it is due.
+
+    Returns a DataFrame indexed by period start (UTC) with the mean and 10th/90th percentile counts.
+    """
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now(tz='UTC')
+    bin_seconds = 3600 if freq == 'h' else 86400
+    origin = now.floor(freq)
+    n_bins = days * 86400 // bin_seconds
+    horizon = n_bins * bin_seconds
+
+    available_at = pd.to_datetime(assignments['available_at'], utc=True)
+    stage = assignments['srs_stage'].to_numpy(dtype='float64', na_value=np.nan)
+    active = (stage >= 1) & available_at.notna().to_numpy()
+    if 'hidden' in assignments:
+        active &= ~assignments['hidden'].fillna(False).astype(bool).to_numpy()
+
+    # SRS system of each item; subjects not in the catalog use the most common system
+    default_id = srs.system_ids[0]
+    if subject_systems is not None:
+        systems = assignments['subject_id'].map(subject_systems)
+        if systems.notna().any():
+            default_id = int(systems.mode().iloc[0])
+    else:
+        systems = pd.Series(np.nan, index=assignments.index)
+    rows = srs.rows_for(systems, default_id)
+    active &= stage < srs.burning[rows]
+
+    items = np.flatnonzero(active)
+    offsets = (available_at.iloc[items] - origin).dt.total_seconds().to_numpy()
+    offsets = np.maximum(offsets, (now - origin).total_seconds())
+    rows = rows[items]
+    stages = stage[items].astype(np.int64)
+    pass_rate = assignments['subject_type'].astype(str).iloc[items].map(rates).fillna(DEFAULT_PASS_RATE).to_numpy()
+
+    # Flatten runs x items into one state vector and carry only reviews still inside the horizon
+    run = np.repeat(np.arange(runs), len(items))
+    item = np.tile(np.arange(len(items)), runs)
+    due = np.tile(offsets, runs)
+    stages = np.tile(stages, runs)
+    counts = np.zeros((runs, n_bins), dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    pending = due < horizon
+    run, item, due, stages = run[pending], item[pending], due[pending], stages[pending]
+    while len(due):
+        np.add.at(counts, (run, (due // bin_seconds).astype(np.int64)), 1)
+
+        system = rows[item]
+        passed = rng.random(len(due)) < pass_rate[item]
+        penalty = np.where(stages >= srs.passing[system], 2, 1)
+        stages = np.where(passed, stages + 1, np.maximum(stages - penalty, srs.starting[system]))
+        due = due + srs.intervals[system, stages]
+
+        # Burned items have no next interval (NaN) and fall out with everything past the horizon
+        pending = due < horizon
+        run, item, due, stages = run[pending], item[pending], due[pending], stages[pending]
+
+    index = pd.date_range(origin, periods=n_bins, freq=freq)
+    return pd.DataFrame({
+        'expected': counts.mean(axis=0),
+        'low': np.percentile(counts, 10, axis=0),
+        'high': np.percentile(counts, 90, axis=0),
+    }, index=index)
@@ -0,0 +1,17 @@
+import gc
+import os
+
+# Build the app once in the master process; workers are forked from it instead of importing it themselves
+wsgi_app = 'app:create_app()'
+preload_app = True
+
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'  # Job event streams hold a thread each
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+def when_ready(server):
+    """Warm up shared state in the master before the first worker is forked"""
+    server.app.wsgi().extensions['wanikani'].warm_up()
+    # Objects loaded so far are never freed; freezing them keeps the workers' garbage collector from
+    # touching (and so copying) the pages they live on
+    gc.freeze()
@@ -0,0 +1,241 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import JOBS, stage_timer
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key  # Jobs for the same account share a key and are coalesced
+        self.status = 'queued'
+        self.stage = None
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.changed = threading.Condition()
+        self.claim = None  # Open lock file that marks the key as taken across worker processes
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error')
+
+    def to_dict(self, include_result=True):
+        """JSON-serialisable view of the job for status responses"""
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'events': self.events,
+            'error': self.error,
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+class JobManager:
+    def __init__(self, max_workers=2, max_pending=20, retention_seconds=3600, state_dir="data/jobs"):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending  # Queued plus running jobs
+        self.retention = retention_seconds  # How long finished jobs stay queryable
+        self.state_dir = state_dir
+        self.jobs = {}
+        self.active = {}  # key -> unfinished job
+        self.lock = threading.Lock()
+        os.makedirs(self.state_dir, exist_ok=True)
+        for status in ('queued', 'running'):
+            JOBS.set_function(lambda status=status: self.depth(status), status=status)
+
+    def depth(self, status):
+        """Number of unfinished jobs in a status, for the queue depth gauge"""
+        with self.lock:
+            return sum(1 for job in self.active.values() if job.status == status)
+
+    def _persist(self, job):
+        """Write the job status to disk so any worker process can answer status polls"""
+        path = os.path.join(self.state_dir, f"{job.id}.json")
+        tmp_path = path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    def _purge(self):
+        """Forget finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self.jobs[job_id]
+                path = os.path.join(self.state_dir, f"{job_id}.json")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _update(self, job, **changes):
+        """Apply changes to a job and wake up anyone waiting on its events"""
+        with job.changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            self._persist(job)
+            job.changed.notify_all()
+
+    def progress(self, job, stage, message):
+        """Record that a job has reached a new stage"""
+        with job.changed:
+            job.stage = stage
+            job.events.append({'stage': stage, 'message': message, 'time': time.time()})
+            self._persist(job)
+            job.changed.notify_all()
+
+    def _claim_path(self, key):
+        return os.path.join(self.state_dir, f"{key}.lock")
+
+    def _claim(self, key, job_id):
+        """Take the key for job_id across every worker process, or return the id of the job that holds it.
+
+        The lock on <key>.lock is held until the job finishes (or its process dies) and the file holds the
+        owning job's id; a short lock on .submit.lock keeps claims and releases from interleaving.
+        """
+        with open(os.path.join(self.state_dir, '.submit.lock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            claim = open(self._claim_path(key), 'a+')
+            try:
+                fcntl.flock(claim, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                claim.seek(0)
+                owner = claim.read().strip()
+                claim.close()
+                return None, owner
+            claim.truncate(0)
+            claim.write(job_id)
+            claim.flush()
+            return claim, job_id
+
+    def _release(self, job):
+        """Give up the job's claim on its key so the next analysis of the account can start"""
+        with open(os.path.join(self.state_dir, '.submit.lock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            os.remove(self._claim_path(job.key))
+            job.claim.close()
+            job.claim = None
+
+    def claimed_keys(self):
+        """Keys with an unfinished job in any worker process, from the claims held on them"""
+        claimed = set()
+        with open(os.path.join(self.state_dir, '.submit.lock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            for filename in os.listdir(self.state_dir):
+                if filename.startswith('.') or not filename.endswith('.lock'):
+                    continue
+                path = os.path.join(self.state_dir, filename)
+                with open(path, 'a') as claim:
+                    try:
+                        fcntl.flock(claim, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        claimed.add(filename[:-len('.lock')])
+                        continue
+                    os.remove(path)  # Left behind by a process that died mid-job
+        return claimed
+
+    def submit(self, key, task, *args):
+        """Queue task(job, *args) and return the job id, or the id of the unfinished job for the same key.
+
+        Jobs for a key are coalesced across worker processes too, since they share the account's directory.
+        """
+        with self.lock:
+            self._purge()
+            existing = self.active.get(key)
+            if existing and not existing.finished:
+                return existing.id
+            if len(self.active) >= self.max_pending:
+                raise QueueFullError("Too many analyses are running, please try again shortly")
+
+            job = Job(key)
+            job.claim, owner = self._claim(key, job.id)
+            if job.claim is None:
+                # Another worker process is already analyzing this account
+                return owner
+            self.jobs[job.id] = job
+            self.active[key] = job
+            self._persist(job)
+
+        self.executor.submit(self._run, job, task, args)
+        return job.id
+
+    def _run(self, job, task, args):
+        """Worker-thread wrapper that records the outcome of a job"""
+        self._update(job, status='running')
+        try:
+            with stage_timer('job'):
+                result = task(job, *args)
+            self._update(job, status='done', result=result, finished_at=time.time())
+        except Exception as e:
+            self._update(job, status='error', error=str(e), finished_at=time.time())
+        finally:
+            with self.lock:
+                if self.active.get(job.key) is job:
+                    del self.active[job.key]
+                self._release(job)
+
+    def get(self, job_id):
+        """Job status as a dict, from memory or from another worker's state file"""
+        job = self.jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        path = os.path.join(self.state_dir, f"{os.path.basename(job_id)}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _stream_state_file(self, job_id, timeout, poll_interval=1.0):
+        """Server-Sent Events for a job run by another worker process, by polling its state file"""
+        sent = 0
+        idle = 0.0
+        while True:
+            state = self.get(job_id)
+            if state is None:
+                return
+            events = state['events'][sent:]
+            for event in events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if state['status'] in ('done', 'error'):
+                yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+                return
+            idle = 0.0 if events else idle + poll_interval
+            if idle >= timeout:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(poll_interval)
+
+    def stream(self, job_id, timeout=15):
+        """Yield Server-Sent Events for a job's progress until it finishes"""
+        job = self.jobs.get(job_id)
+        if not job:
+            yield from self._stream_state_file(job_id, timeout)
+            return
+        sent = 0
+        while True:
+            with job.changed:
+                if sent == len(job.events) and not job.finished:
+                    job.changed.wait(timeout)
+                events = job.events[sent:]
+                finished = job.finished
+            for event in events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if finished:
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if not events:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
@@ -0,0 +1,229 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MAX_LEVEL = 60
+KANJI_TO_PASS = 0.9  # Share of a level's kanji that must reach Guru to level up
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+MAX_REVIEWS = 100  # Cap on simulated reviews per item; unlucky stragglers are counted as passed
+SECONDS_PER_DAY = 86400
+
+# Process-wide simulation pools by size, started on first use and reused by every prediction
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool(max_workers):
+    """Long-lived pool whose workers come from a forkserver, never forked from a threaded web worker"""
+    with _pools_lock:
+        if max_workers not in _pools:
+            _pools[max_workers] = ProcessPoolExecutor(max_workers=max_workers,
+                                                      mp_context=multiprocessing.get_context('forkserver'))
+        return _pools[max_workers]
+
+class LevelModel:
+    """Everything a simulated trajectory needs, as plain arrays so batches can be shipped to worker processes"""
+    def __init__(self, current_level, elapsed_days, radicals, kanji, intervals, passing, pass_rates, slack_days):
+        self.current_level = current_level
+        self.elapsed_days = elapsed_days  # Time already spent on the current level
+        self.radicals = radicals  # Items per level, indexed by level
+        self.kanji = kanji
+        self.intervals = intervals  # intervals[level, stage] in days, from the level's SRS system
+        self.passing = passing  # Guru stage per level
+        self.pass_rates = pass_rates  # {'radical': p, 'kanji': p}
+        self.slack_days = slack_days  # Historical time per level not explained by SRS waits
+
+    @property
+    def minimum_days(self):
+        """Fastest possible time per level, with every review answered correctly"""
+        stages = np.arange(self.intervals.shape[1])[None, :]
+        to_guru = np.where((stages >= 1) & (stages < self.passing[:, None]), self.intervals, 0.0).sum(axis=1)
+        return to_guru * ((self.radicals > 0).astype(int) + (self.kanji > 0).astype(int))
+
+    @property
+    def levels(self):
+        """Levels still to pass before reaching MAX_LEVEL"""
+        return np.arange(self.current_level, MAX_LEVEL)
+
+def guru_days(intervals, passing, pass_rate, size, rng):
+    """Days for each of size x n items to reach Guru from their first review stage.
+
+    A review at a stage happens that stage's interval after reaching it; a miss drops the item one stage,
+    which is the WaniKani penalty below Guru. All items of all trials step forward together, and items
+    drop out of the working set as soon as they reach Guru.
+    """
+    n = len(pass_rate)
+    stage = np.ones(size * n, dtype=np.int64)
+    days = np.zeros(size * n)
+    live = np.flatnonzero(stage < np.tile(passing, size))
+    for _ in range(MAX_REVIEWS):
+        if not len(live):
+            break
+        item = live % n
+        current = stage[live]
+        days[live] += intervals[item, current]
+        passed = rng.random(len(live)) < pass_rate[item]
+        current = np.where(passed, current + 1, np.maximum(current - 1, 1))
+        stage[live] = current
+        live = live[current < passing[item]]
+    return days.reshape(size, n)
+
+def level_days(model, levels, size, rng):
+    """Simulated days to pass each level: all radicals to Guru, then 90% of the kanji they unlock"""
+    radicals = model.radicals[levels]
+    kanji = model.kanji[levels]
+    item_levels = np.concatenate([np.repeat(levels, radicals), np.repeat(levels, kanji)])
+    is_kanji = np.concatenate([np.zeros(radicals.sum(), dtype=bool), np.ones(kanji.sum(), dtype=bool)])
+    pass_rate = np.where(is_kanji, model.pass_rates['kanji'], model.pass_rates['radical'])
+    days = guru_days(model.intervals[item_levels], model.passing[item_levels], pass_rate, size, rng)
+
+    durations = np.zeros((size, len(levels)))
+    radical_start = np.concatenate([[0], np.cumsum(radicals)[:-1]])
+    kanji_start = radicals.sum() + np.concatenate([[0], np.cumsum(kanji)[:-1]])
+    for column in range(len(levels)):
+        if radicals[column]:
+            start = radical_start[column]
+            durations[:, column] += days[:, start:start + radicals[column]].max(axis=1)
+        if kanji[column]:
+            start = kanji_start[column]
+            needed = int(np.ceil(kanji[column] * KANJI_TO_PASS))
+            level_kanji = np.partition(days[:, start:start + kanji[column]], needed - 1, axis=1)
+            durations[:, column] += level_kanji[:, needed - 1]
+    return durations
+
+def simulate_batch(model, seed_sequence, size):
+    """Cumulative days until each remaining level is reached, for size independent trajectories"""
+    rng = np.random.default_rng(seed_sequence)
+    levels = model.levels
+    durations = level_days(model, levels, size, rng)
+    srs_only = durations[:, 0].copy()
+    if len(model.slack_days):
+        # Time the SRS cannot explain (lessons, breaks, late reviews), resampled from the learner's own history
+        durations = np.maximum(durations + rng.choice(model.slack_days, size=durations.shape), model.minimum_days[levels])
+
+    # The current level is partly done: condition on it taking longer than the time already spent
+    current = durations[:, 0]
+    longer = current > model.elapsed_days
+    if longer.any():
+        durations[:, 0] = rng.choice(current[longer], size=size) - model.elapsed_days
+    else:
+        # Already past every simulated outcome (e.g. back from a break): assume the level's SRS waits still lie ahead
+        durations[:, 0] = srs_only
+    return np.cumsum(durations, axis=1)
+
+def build_model(level_progressions, subjects, srs, pass_rates, now, history_levels=20, seed=0):
+    """Model inputs for a learner: their current level, curriculum sizes, SRS intervals and pace history"""
+    progressions = level_progressions
+    if 'abandoned_at' in progressions:
+        progressions = progressions[progressions['abandoned_at'].isna()]
+    progressions = progressions.sort_values('level')
+    current = progressions.iloc[-1] if len(progressions) else None
+    current_level = int(current['level']) if current is not None else 1
+    started_at = pd.NaT if current is None else current['started_at'] if pd.notna(current['started_at']) else current['unlocked_at']
+    elapsed_days = (pd.Timestamp(now) - pd.Timestamp(started_at)).total_seconds() / SECONDS_PER_DAY if pd.notna(started_at) else 0.0
+    elapsed_days = max(elapsed_days, 0.0)
+
+    if 'hidden' in subjects:
+        subjects = subjects[~subjects['hidden'].fillna(False).astype(bool)]
+    level = subjects['level'].to_numpy(dtype='float64', na_value=np.nan)
+    subject_type = subjects['type'].astype(str).to_numpy()
+    bins = np.arange(MAX_LEVEL + 2)
+    radicals = np.histogram(level[subject_type == 'radical'], bins=bins)[0]
+    kanji = np.histogram(level[subject_type == 'kanji'], bins=bins)[0]
+
+    # Each level uses the SRS system most of its subjects are on (the accelerated one for the first levels)
+    level_rows = np.zeros(MAX_LEVEL + 1, dtype=np.int64)
+    if 'spaced_repetition_system_id' in subjects:
+        systems = pd.DataFrame({'level': subjects['level'], 'system': subjects['spaced_repetition_system_id']}).dropna()
+        modes = systems.groupby('level')['system'].agg(lambda values: values.mode().iloc[0])
+        level_rows[modes.index.astype(int)] = srs.rows_for(modes.to_numpy(), srs.system_ids[0])
+    intervals = np.nan_to_num(srs.intervals[level_rows] / SECONDS_PER_DAY)
+    passing = srs.passing[level_rows]
+    rates = {subject_type: float(np.clip(pass_rates.get(subject_type, 0.85), 0.05, 1.0)) for subject_type in ['radical', 'kanji']}
+
+    model = LevelModel(current_level, elapsed_days, radicals, kanji, intervals, passing, rates, np.array([]))
+
+    # Slack: how much longer each recently passed level took than the SRS alone predicts
+    passed = progressions[progressions['passed_at'].notna() & progressions['started_at'].notna()].tail(history_levels)
+    if len(passed):
+        passed_levels = passed['level'].to_numpy(dtype='int64')
+        observed = (pd.to_datetime(passed['passed_at'], utc=True) - pd.to_datetime(passed['started_at'], utc=True)).dt.total_seconds().to_numpy() / SECONDS_PER_DAY
+        expected = level_days(model, passed_levels, 200, np.random.default_rng(seed)).mean(axis=0)
+        model.slack_days = observed - expected
+    return model
+
+def quantile_half_widths(samples, quantiles=QUANTILES, z=1.96):
+    """Half-width of the distribution-free confidence interval of each quantile, from order statistics"""
+    samples = np.sort(samples)
+    n = len(samples)
+    widths = []
+    for q in quantiles:
+        spread = z * np.sqrt(n * q * (1 - q))
+        low = int(max(np.floor(n * q - spread), 0))
+        high = int(min(np.ceil(n * q + spread), n - 1))
+        widths.append((samples[high] - samples[low]) / 2)
+    return np.array(widths)
+
+def predict_level_up(model, seed=0, batch_size=500, batches_per_round=4, min_trials=2000, max_trials=50000,
+                     tolerance=0.01, min_tolerance_days=0.5, max_workers=None):
+    """Monte Carlo ETA distributions for the next level and for level 60.
+
+    Batches run in fixed-size rounds. The first round runs inline, since it usually converges already; later
+    rounds are spread across a shared process pool. Every batch gets its own child of one SeedSequence, so
+    results depend only on the seed, never on the number of workers. Simulation stops once
+    the confidence interval of every reported quantile is within tolerance of the median
+    (or min_tolerance_days, whichever is larger).
+    """
+    if model.current_level >= MAX_LEVEL:
+        return {'current_level': model.current_level, 'trials': 0, 'converged': True, 'levels': {}}
+
+    max_workers = max_workers or os.cpu_count() or 1
+    root = np.random.SeedSequence(seed)
+    results = []
+    converged = False
+    while sum(len(batch) for batch in results) < max_trials:
+        seeds = root.spawn(batches_per_round)
+        batches = None
+        if results and max_workers > 1:
+            try:
+                batches = list(_pool(max_workers).map(simulate_batch, [model] * len(seeds), seeds, [batch_size] * len(seeds)))
+            except BrokenProcessPool:
+                logger.warning("Simulation pool failed; continuing in this process")
+                with _pools_lock:
+                    _pools.pop(max_workers, None)
+        if batches is None:
+            batches = [simulate_batch(model, seed_sequence, batch_size) for seed_sequence in seeds]
+        results.extend(batches)
+
+        trials = np.concatenate(results)
+        if len(trials) < min_trials:
+            continue
+        targets = trials[:, [0, -1]]
+        converged = all(
+            (quantile_half_widths(targets[:, column]) <= max(tolerance * np.median(targets[:, column]), min_tolerance_days)).all()
+            for column in range(targets.shape[1])
+        )
+        if converged:
+            break
+
+    trials = np.concatenate(results)
+    bands = np.quantile(trials, QUANTILES, axis=0)
+    levels = {
+        int(level): {f"p{int(q * 100)}": float(days) for q, days in zip(QUANTILES, bands[:, column])}
+        for column, level in enumerate(model.levels + 1)
+    }
+    logger.info("Simulated %d level-up trajectories (converged: %s)", len(trials), converged)
+    return {
+        'current_level': model.current_level,
+        'trials': len(trials),
+        'converged': converged,
+        'next_level': levels[model.current_level + 1],
+        'level_60': levels[MAX_LEVEL],
+        'levels': levels,
+    }
@@ -0,0 +1,167 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the stage timer buckets
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key):
+    if not key:
+        return ''
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in key) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """One named metric with a value per label set"""
+    kind = 'untyped'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self.functions = {}  # label key -> callable read at scrape time
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Report the value of function() on every scrape, e.g. a queue length"""
+        with self.lock:
+            self.functions[_label_key(labels)] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self.lock:
+            functions = list(self.functions.items())
+        return samples + [(self.name, key, function()) for key, function in functions]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        for _, key, (counts, total, count) in super().samples():
+            for bound, bucket_count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", key + (('le', f"{bound:g}"),), bucket_count))
+            samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+class Registry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format"""
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help_text, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Shared pipeline metrics; each module records into these rather than defining its own
+STAGE_SECONDS = REGISTRY.histogram('wanikani_stage_seconds', 'Time spent in each pipeline stage')
+API_REQUESTS = REGISTRY.counter('wanikani_api_requests_total', 'HTTP requests made to the WaniKani API, by status')
+API_PAGES = REGISTRY.counter('wanikani_api_pages_total', 'Collection pages fetched from the WaniKani API')
+API_BYTES = REGISTRY.counter('wanikani_api_bytes_total', 'Response body bytes downloaded from the WaniKani API')
+CACHE_REQUESTS = REGISTRY.counter('wanikani_cache_requests_total', 'Cache lookups by cache and result (hit or miss)')
+ROWS_PROCESSED = REGISTRY.counter('wanikani_rows_processed_total', 'Records written per pipeline layer and endpoint')
+JOBS = REGISTRY.gauge('wanikani_jobs', 'Analysis jobs by status')
+
+def stage_timer(stage, **labels):
+    """Context manager that records how long a pipeline stage took"""
+    return STAGE_SECONDS.time(stage=stage, **labels)
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+@contextmanager
+def profiled(path):
+    """Run the enclosed block under cProfile and dump the stats to path (current thread only)"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profiler.dump_stats(path)
+
+def profile_summary(path, limit=40):
+    """Top functions of a saved profile by cumulative time, as text"""
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
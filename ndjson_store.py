@@ -0,0 +1,47 @@
+import json
+import os
+
+def dump_record(record):
+    """Serialise a single record as one compact NDJSON line"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def iter_records(filepath):
+    """Yield records one at a time from an NDJSON snapshot (or a legacy JSON array)"""
+    if filepath.endswith('.json'):
+        # Legacy snapshots are a single JSON array and have to be loaded whole
+        with open(filepath, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_record_chunks(filepath, chunk_size=5000):
+    """Yield lists of at most chunk_size records from a snapshot"""
+    chunk = []
+    for record in iter_records(filepath):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def append_records(f, records):
+    """Append records to an open NDJSON file, returning how many were written"""
+    count = 0
+    for record in records:
+        f.write(dump_record(record))
+        count += 1
+    return count
+
+def write_records(filepath, records):
+    """Write an iterable of records to an NDJSON file atomically, returning the record count"""
+    # Hidden temp name so directory scans by endpoint prefix never pick it up
+    tmp_path = os.path.join(os.path.dirname(filepath), '.' + os.path.basename(filepath) + '.part')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        count = append_records(f, records)
+    os.replace(tmp_path, filepath)
+    return count
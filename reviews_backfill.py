@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from data_fetcher import WaniKaniDataFetcher
+from flattening import flatten_records
+from ndjson_store import append_records, iter_record_chunks
+from config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"  # WaniKani's timestamp format
+
+def parse_timestamp(value):
+    """Parse a WaniKani timestamp into an aware UTC datetime"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+class ReviewsBackfill:
+    """Fetch the full review history as date-window partitions, resumable after a crash"""
+    def __init__(self, fetcher, window_days=30, start=None):
+        self.fetcher = fetcher  # Supplies the key, scheduler and data directories
+        self.window = timedelta(days=window_days)
+        self.start = start  # First day of history; the account's start date when None
+        self.partition_dir = os.path.join(fetcher.raw_data_dir, "reviews")
+        os.makedirs(self.partition_dir, exist_ok=True)
+
+    def _account_start(self):
+        """When the account started, which bounds the review history"""
+        user, _ = self.fetcher._fetch_collection('user')
+        started_at = user[0].get('started_at') if user else None
+        if not started_at:
+            raise ValueError("Could not determine when the account started; pass a start date")
+        return parse_timestamp(started_at)
+
+    def windows(self, now=None):
+        """(start, end) pairs covering the history up to now; windows are aligned to whole days"""
+        now = now or datetime.now(timezone.utc)
+        start = self.start or self._account_start()
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        windows = []
+        while start <= now:
+            windows.append((start, start + self.window))
+            start += self.window
+        return windows
+
+    def partition_path(self, window_start, window_end):
+        return os.path.join(self.partition_dir, f"reviews_{window_start:%Y%m%d}_{window_end:%Y%m%d}.ndjson")
+
+    def _done_path(self, path):
+        return path + '.done'
+
+    def is_complete(self, window_start, window_end):
+        """A window is complete once its partition and done marker are both on disk"""
+        path = self.partition_path(window_start, window_end)
+        return os.path.exists(path) and os.path.exists(self._done_path(path))
+
+    def fetch_window(self, window_start, window_end, now):
+        """Fetch one window into its partition, returning the number of reviews written.
+
+        The API only filters by updated_after, but reviews come back in id order, which follows the time they
+        were made, so paging stops at the first page that reaches past the window.
+        """
+        path = self.partition_path(window_start, window_end)
+        tmp_path = os.path.join(self.fetcher.staging_dir, os.path.basename(path))
+        params = {'updated_after': window_start.strftime(TIMESTAMP_FORMAT)}
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for page in self.fetcher._iter_pages('reviews', params):
+                count += append_records(f, (
+                    record for record in page
+                    if parse_timestamp(record['data_updated_at']) < window_end
+                ))
+                if page and parse_timestamp(page[-1]['data_updated_at']) >= window_end:
+                    break
+        os.replace(tmp_path, path)
+
+        # The window still open at the end of history is refetched on the next run
+        if window_end <= now:
+            with open(self._done_path(path), 'w', encoding='utf-8') as f:
+                json.dump({'count': count, 'completed_at': datetime.now(timezone.utc).isoformat()}, f)
+        logger.info("Saved %d reviews for %s to %s", count, f"{window_start:%Y-%m-%d}", f"{window_end:%Y-%m-%d}")
+        return count
+
+    def run(self, now=None):
+        """Fetch every incomplete window concurrently; the scheduler keeps all of them under the rate limit"""
+        now = now or datetime.now(timezone.utc)
+        windows = self.windows(now)
+        pending = [window for window in windows if not self.is_complete(*window)]
+        logger.info("Backfilling reviews: %d of %d windows to fetch", len(pending), len(windows))
+
+        tasks = {
+            f"{window_start:%Y%m%d}": (lambda window_start=window_start, window_end=window_end:
+                                       self.fetch_window(window_start, window_end, now))
+            for window_start, window_end in pending
+        }
+        results = self.fetcher.scheduler.run(tasks)
+
+        failed = {name: result for name, result in results.items() if isinstance(result, Exception)}
+        for name, error in failed.items():
+            logger.error("Error fetching reviews window %s: %s", name, error)
+        return {
+            'windows': len(windows),
+            'fetched': len(pending) - len(failed),
+            'failed': sorted(failed),
+            'reviews': sum(result for result in results.values() if not isinstance(result, Exception)),
+        }
+
+    def partitions(self):
+        """Partition files in chronological order"""
+        return sorted(
+            os.path.join(self.partition_dir, filename)
+            for filename in os.listdir(self.partition_dir)
+            if filename.startswith('reviews_') and filename.endswith('.ndjson')
+        )
+
+    def load(self, chunk_size=5000):
+        """Every backfilled review as one typed table"""
+        frames = [
+            flatten_records('reviews', chunk)['reviews']
+            for path in self.partitions()
+            for chunk in iter_record_chunks(path, chunk_size)
+        ]
+        if not frames:
+            return pd.DataFrame()
+        # Windows never overlap, but a review updated later can appear in a later window too
+        return pd.concat(frames, ignore_index=True).drop_duplicates('id', keep='last')
+
+if __name__ == "__main__":
+    configure_logging()
+    backfill = ReviewsBackfill(WaniKaniDataFetcher())
+    print(backfill.run())
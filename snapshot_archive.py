@@ -0,0 +1,215 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from ndjson_store import dump_record, iter_records
+from snapshot_catalog import parse_snapshot_filename
+
+logger = logging.getLogger(__name__)
+
+DELETED = '_deleted'  # Marker field of a tombstone record in a delta
+
+def _iter_gzip_records(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class SnapshotArchive:
+    """Expired raw snapshots of each endpoint, stored as compressed base snapshots plus per-record deltas.
+
+    archive/<endpoint>/manifest.json lists the chain in time order. A base holds every record; a delta
+    holds only the records whose data_updated_at changed since the previous version, plus tombstones for
+    ids that disappeared. Any version can be rebuilt from the last base at or before it and the deltas after.
+    """
+    def __init__(self, archive_dir="data/archive", retention_days=365, max_deltas=30):
+        self.archive_dir = archive_dir
+        self.retention = timedelta(days=retention_days) if retention_days is not None else None
+        self.max_deltas = max_deltas  # Deltas allowed after a base before the next version is written as a base
+        self.lock = threading.Lock()  # Endpoints archive concurrently, but one chain is only changed by one thread
+
+    @staticmethod
+    def local_time(timestamp):
+        """Catalog timestamps are naive local time; accept ISO strings and aware datetimes too"""
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        return timestamp.astimezone().replace(tzinfo=None) if timestamp.tzinfo else timestamp
+
+    def _endpoint_dir(self, endpoint):
+        return os.path.join(self.archive_dir, endpoint)
+
+    def _manifest_path(self, endpoint):
+        return os.path.join(self._endpoint_dir(endpoint), 'manifest.json')
+
+    def manifest(self, endpoint):
+        """Chain entries of an endpoint, oldest first"""
+        path = self._manifest_path(endpoint)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['entries']
+
+    def _save_manifest(self, endpoint, entries):
+        path = self._manifest_path(endpoint)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'endpoint': endpoint, 'entries': entries}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _write(self, endpoint, kind, as_of, records):
+        """Write one gzip NDJSON chain file, returning its name and record count"""
+        filename = f"{kind}_{as_of:%Y%m%d_%H%M%S}.ndjson.gz"
+        path = os.path.join(self._endpoint_dir(endpoint), filename)
+        tmp_path = path + '.part'
+        count = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(dump_record(record))
+                count += 1
+        os.replace(tmp_path, path)
+        return filename, count
+
+    def _replay(self, endpoint, entries):
+        """Apply a base and its deltas in order, returning {id: record}"""
+        state = {}
+        for entry in entries:
+            path = os.path.join(self._endpoint_dir(endpoint), entry['file'])
+            if entry['kind'] == 'base':
+                state = {}
+            for record in _iter_gzip_records(path):
+                if record.get(DELETED):
+                    state.pop(record['id'], None)
+                else:
+                    state[record['id']] = record
+        return state
+
+    def _chain_for(self, entries, as_of=None):
+        """The entries needed to rebuild the newest version at or before as_of"""
+        if as_of is not None:
+            entries = [entry for entry in entries if entry['as_of'] <= as_of.isoformat()]
+        bases = [index for index, entry in enumerate(entries) if entry['kind'] == 'base']
+        return entries[bases[-1]:] if bases else []
+
+    def add(self, endpoint, snapshot_path, as_of, source_hash=None):
+        """Archive a full raw snapshot taken at as_of, as a delta against the previous version when possible"""
+        as_of = self.local_time(as_of)
+        with self.lock:
+            os.makedirs(self._endpoint_dir(endpoint), exist_ok=True)
+            entries = self.manifest(endpoint)
+            if entries and entries[-1]['as_of'] >= as_of.isoformat():
+                logger.warning("Skipping %s snapshot from %s; the archive already has newer data", endpoint, as_of)
+                return None
+
+            chain = self._chain_for(entries)
+            if not chain or len(chain) - 1 >= self.max_deltas:
+                # Compaction: start a fresh base so rebuilding never replays more than max_deltas files
+                filename, count = self._write(endpoint, 'base', as_of, sorted(iter_records(snapshot_path), key=lambda record: record['id']))
+                kind = 'base'
+            else:
+                previous = self._replay(endpoint, chain)
+                filename, count = self._write(endpoint, 'delta', as_of, self._diff(previous, iter_records(snapshot_path)))
+                kind = 'delta'
+
+            entries.append({'kind': kind, 'file': filename, 'as_of': as_of.isoformat(), 'records': count,
+                            'source_hash': source_hash})
+            self._save_manifest(endpoint, entries)
+            logger.info("Archived %s snapshot from %s as a %s of %d records", endpoint, as_of, kind, count)
+            self._apply_retention(endpoint, entries)
+            return os.path.join(self._endpoint_dir(endpoint), filename)
+
+    def _diff(self, previous, records):
+        """Records that are new or whose data_updated_at changed, then tombstones for removed ids"""
+        seen = set()
+        for record in records:
+            seen.add(record['id'])
+            old = previous.get(record['id'])
+            if old is None or old.get('data_updated_at') != record.get('data_updated_at'):
+                yield record
+        for record_id in previous.keys() - seen:
+            yield {'id': record_id, DELETED: True}
+
+    def compact(self, endpoint):
+        """Fold the current chain into a new base at the newest version"""
+        with self.lock:
+            entries = self.manifest(endpoint)
+            chain = self._chain_for(entries)
+            if len(chain) <= 1:
+                return None
+            head = chain[-1]
+            state = self._replay(endpoint, chain)
+            as_of = datetime.fromisoformat(head['as_of'])
+            filename, count = self._write(endpoint, 'base', as_of, (state[record_id] for record_id in sorted(state)))
+            # The new base replaces the head delta; older versions stay readable until retention removes them
+            entries[-1] = {'kind': 'base', 'file': filename, 'as_of': head['as_of'], 'records': count,
+                           'source_hash': head.get('source_hash')}
+            self._save_manifest(endpoint, entries)
+            os.remove(os.path.join(self._endpoint_dir(endpoint), head['file']))
+            self._apply_retention(endpoint, entries)
+            return os.path.join(self._endpoint_dir(endpoint), filename)
+
+    def _apply_retention(self, endpoint, entries):
+        """Drop chain files that are not needed to rebuild any version newer than the retention cutoff"""
+        if self.retention is None:
+            return
+        cutoff = (datetime.now() - self.retention).isoformat()
+        # Everything before the newest base at or before the cutoff can go
+        keep_from = 0
+        for index, entry in enumerate(entries):
+            if entry['kind'] == 'base' and entry['as_of'] <= cutoff:
+                keep_from = index
+        if keep_from == 0:
+            return
+        for entry in entries[:keep_from]:
+            path = os.path.join(self._endpoint_dir(endpoint), entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+        self._save_manifest(endpoint, entries[keep_from:])
+        logger.info("Removed %d archived %s versions past retention", keep_from, endpoint)
+
+    def migrate_legacy(self, endpoint):
+        """Fold full snapshots moved into archive/<endpoint>/ by older versions into the chain"""
+        directory = self._endpoint_dir(endpoint)
+        if not os.path.isdir(directory):
+            return 0
+        legacy = []
+        for filename in os.listdir(directory):
+            if not filename.startswith((f"{endpoint}_", f"curated_{endpoint}_")) or filename.endswith(('.gz', '.part')):
+                continue
+            _, timestamp = parse_snapshot_filename(filename.replace('curated_', '', 1))
+            if timestamp is not None:
+                legacy.append((timestamp, filename))
+        migrated = 0
+        for timestamp, filename in sorted(legacy):
+            path = os.path.join(directory, filename)
+            # Raw snapshots become versions; old processed and curated tables are derived data and are dropped
+            if filename.startswith(f"{endpoint}_") and filename.endswith(('.json', '.ndjson')):
+                self.add(endpoint, path, timestamp)
+                migrated += 1
+            os.remove(path)
+        return migrated
+
+    def versions(self, endpoint):
+        """Timestamps of every archived version of an endpoint"""
+        return [datetime.fromisoformat(entry['as_of']) for entry in self.manifest(endpoint)]
+
+    def as_of(self, endpoint, timestamp):
+        """Rebuild an endpoint as it was at timestamp: (version time, records sorted by id), or None.
+
+        Only the last base at or before timestamp and the deltas after it are decompressed.
+        """
+        timestamp = self.local_time(timestamp)
+        chain = self._chain_for(self.manifest(endpoint), timestamp)
+        if not chain:
+            return None
+        state = self._replay(endpoint, chain)
+        return datetime.fromisoformat(chain[-1]['as_of']), [state[record_id] for record_id in sorted(state)]
+
+    def disk_usage(self, endpoint=None):
+        """Bytes used by the archive, or by one endpoint's chain"""
+        root = self._endpoint_dir(endpoint) if endpoint else self.archive_dir
+        total = 0
+        for directory, _, files in os.walk(root):
+            total += sum(os.path.getsize(os.path.join(directory, filename)) for filename in files)
+        return total
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    path TEXT PRIMARY KEY,
+    layer TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    content_hash TEXT,
+    row_count INTEGER,
+    source_path TEXT,
+    source_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'active'
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_latest ON snapshots (layer, endpoint, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_snapshots_source ON snapshots (layer, endpoint, source_hash);
+"""
+
+def file_hash(filepath, block_size=1 << 20):
+    """SHA-256 of a file, read in blocks so large snapshots are never loaded whole"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_snapshot_filename(filename):
+    """Split a legacy snapshot filename (XXXX_YYYYMMDD_HHMMSS.ext) into endpoint and timestamp"""
+    stem = filename.split('.')[0]
+    parts = stem.split('_')
+    if len(parts) < 3:
+        return None, None
+    try:
+        timestamp = datetime.strptime(parts[-2] + '_' + parts[-1], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None, None
+    return '_'.join(parts[:-2]), timestamp
+
+class SnapshotCatalog:
+    def __init__(self, db_path="data/catalog.sqlite"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Open a connection; one per call keeps the catalog safe to use from worker threads"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, layer, endpoint, path, content_hash=None, row_count=None,
+               source_path=None, source_hash=None, created_at=None, status='active'):
+        """Add or replace the catalog entry for a snapshot file"""
+        created_at = (created_at or datetime.now()).isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots "
+                "(path, layer, endpoint, created_at, content_hash, row_count, source_path, source_hash, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, layer, endpoint, created_at, content_hash, row_count, source_path, source_hash, status),
+            )
+        return self.get(path)
+
+    def get(self, path):
+        """Look up a snapshot by its path"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM snapshots WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def latest(self, layer, endpoint):
+        """Newest active snapshot for an endpoint in a layer, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND endpoint = ? AND status = 'active' "
+                "ORDER BY created_at DESC LIMIT 1",
+                (layer, endpoint),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def active_as_of(self, layer, endpoint, timestamp):
+        """Newest active snapshot for an endpoint created at or before a naive local timestamp, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND endpoint = ? AND status = 'active' AND created_at <= ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (layer, endpoint, timestamp.isoformat()),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def latest_per_endpoint(self, layer):
+        """Newest active snapshot of every endpoint in a layer"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND status = 'active' ORDER BY created_at",
+                (layer,),
+            ).fetchall()
+        # Later rows win, leaving the newest entry per endpoint
+        return list({row['endpoint']: dict(row) for row in rows}.values())
+
+    def partial(self, layer):
+        """Downloads of a layer that stopped partway and have not been resumed yet"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND status = 'partial' ORDER BY created_at",
+                (layer,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def derived_from(self, layer, endpoint, source_hash):
+        """Newest active artifact built from a source with the given content hash"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND endpoint = ? AND source_hash = ? AND status = 'active' "
+                "ORDER BY created_at DESC LIMIT 1",
+                (layer, endpoint, source_hash),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def is_fresh(self, entry, max_age):
+        """Check that a snapshot exists on disk and is younger than max_age"""
+        if not entry or not os.path.exists(entry['path']):
+            return False
+        return datetime.now() - datetime.fromisoformat(entry['created_at']) < max_age
+
+    def expired(self, layer, endpoint, max_age):
+        """Active snapshots of an endpoint older than max_age, oldest first"""
+        cutoff = (datetime.now() - max_age).isoformat()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM snapshots WHERE layer = ? AND endpoint = ? AND status = 'active' AND created_at <= ? "
+                "ORDER BY created_at",
+                (layer, endpoint, cutoff),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_status(self, path, status):
+        """Mark a snapshot as no longer active, e.g. 'archived' or 'deleted'"""
+        with self._connect() as conn:
+            conn.execute("UPDATE snapshots SET status = ? WHERE path = ?", (status, path))
+
+    def import_directory(self, layer, directory, strip_prefix=''):
+        """Register snapshot files that predate the catalog, using their filename timestamps"""
+        if not os.path.isdir(directory):
+            return 0
+        imported = 0
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if filename.startswith('.') or not os.path.isfile(path) or self.get(path):
+                continue
+            endpoint, timestamp = parse_snapshot_filename(filename[len(strip_prefix):] if filename.startswith(strip_prefix) else filename)
+            if not endpoint:
+                continue
+            self.record(layer, endpoint, path, content_hash=file_hash(path), created_at=timestamp)
+            imported += 1
+        return imported
+
+    def has_layer(self, layer):
+        """Whether any snapshot of a layer has been recorded"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM snapshots WHERE layer = ? LIMIT 1", (layer,)).fetchone()
+        return row is not None
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Default on-disk format for the processed and curated layers
+DEFAULT_FORMAT = os.getenv('WANIKANI_STORAGE_FORMAT', 'parquet')
+
+def _is_missing(value):
+    """Scalar NaN/None check that is safe to call on lists and dicts"""
+    return value is None or (isinstance(value, float) and value != value)
+
+def _tmp_path(filepath):
+    """Hidden temp name next to the target so half-written files are never picked up"""
+    return os.path.join(os.path.dirname(filepath), '.' + os.path.basename(filepath) + '.part')
+
+class CsvWriter:
+    def __init__(self, filepath, template=None):
+        self.filepath = filepath
+        self.tmp_path = _tmp_path(filepath)
+        self.rows = 0
+        self.header = template.columns if template is not None else None  # CSV keeps only the column names
+        self.columns = None
+
+    def write(self, frame):
+        """Append a DataFrame chunk, aligning it to the template's columns or those of the first chunk"""
+        if self.columns is None:
+            self.columns = self.header if self.header is not None else frame.columns
+            frame.reindex(columns=self.columns).to_csv(self.tmp_path, mode='w', header=True, index=False)
+        else:
+            frame.reindex(columns=self.columns).to_csv(self.tmp_path, mode='a', header=False, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        """Move the finished file into place, returning the number of rows written"""
+        if self.columns is not None:
+            os.replace(self.tmp_path, self.filepath)
+        return self.rows
+
+class ParquetWriter:
+    def __init__(self, storage, filepath, template=None):
+        self.storage = storage
+        self.filepath = filepath
+        self.tmp_path = _tmp_path(filepath)
+        self.template = template  # Empty DataFrame whose dtypes fix the schema, e.g. from the endpoint schema
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+
+    def _fixed_schema(self, frame):
+        """Schema for the whole file, from the template or else the first chunk, widened so later chunks cast to it.
+
+        Columns left untyped (all missing) and categoricals without text categories are stored as text, and
+        categorical columns get 32-bit codes so later chunks can bring more categories. Without a template,
+        plain integer columns are stored as floats, since a later chunk may hold missing or fractional values.
+        """
+        pa = self.storage.pa
+        typed = self.template is not None
+        if typed:
+            frame = self.template
+        schema = self.storage._to_table(frame).schema
+        fields = []
+        for field in schema:
+            dictionary = pa.types.is_dictionary(field.type)
+            value_type = field.type.value_type if dictionary else field.type
+            if pa.types.is_null(value_type) or (dictionary and pa.types.is_floating(value_type)):
+                value_type = pa.string()
+            elif not typed and not dictionary and pa.types.is_integer(value_type) and \
+                    not isinstance(frame[field.name].dtype, pd.api.extensions.ExtensionDtype):
+                value_type = pa.float64()
+            if dictionary:
+                value_type = pa.dictionary(pa.int32(), value_type, field.type.ordered)
+            fields.append(field.with_type(value_type))
+        return pa.schema(fields, metadata=schema.metadata)
+
+    def _conform(self, table):
+        """Cast a chunk to the file's schema, filling columns it lacks with missing values"""
+        pa = self.storage.pa
+        columns = [table[field.name].cast(field.type) if field.name in table.column_names
+                   else pa.nulls(len(table), field.type)
+                   for field in self.schema]
+        return pa.Table.from_arrays(columns, schema=self.schema)
+
+    def write(self, frame):
+        """Append a DataFrame chunk as a row group; the first chunk fixes the schema if there is no template"""
+        table = self.storage._to_table(frame)
+        if self.writer is None:
+            self.schema = self._fixed_schema(frame)
+            self.writer = self.storage.pq.ParquetWriter(self.tmp_path, self.schema,
+                                                        compression=self.storage.compression)
+        if table.num_rows:
+            self.writer.write_table(self._conform(table))
+            self.rows += table.num_rows
+
+    def close(self):
+        """Finish the compressed Parquet file and move it into place, returning the number of rows written"""
+        if self.writer is None:
+            return 0
+        self.writer.close()
+        self.writer = None
+        os.replace(self.tmp_path, self.filepath)
+        return self.rows
+
+class CsvStorage:
+    name = 'csv'
+    extension = '.csv'
+
+    def open_writer(self, filepath, template=None):
+        """Start writing a table chunk by chunk"""
+        return CsvWriter(filepath, template)
+
+    def write_chunks(self, filepath, frames, template=None):
+        """Append DataFrame chunks to a CSV file, returning the number of rows written"""
+        writer = self.open_writer(filepath, template)
+        for frame in frames:
+            writer.write(frame)
+        return writer.close()
+
+    def read(self, filepath, columns=None, memory_map=False):
+        """Read a CSV file, optionally restricted to some columns"""
+        return pd.read_csv(filepath, usecols=columns, memory_map=memory_map)
+
+class ParquetStorage:
+    name = 'parquet'
+    extension = '.parquet'
+
+    def __init__(self, compression='zstd'):
+        # pyarrow is only needed when this backend is actually used
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.compression = compression
+
+    def _encode_object_column(self, series):
+        """Store nested or mixed-type values (meanings, readings, ids lists) as JSON text"""
+        types = {type(value) for value in series if not _is_missing(value)}
+        if len(types) <= 1 and types <= {str, bool}:
+            return series
+        return series.map(lambda value: None if _is_missing(value) else json.dumps(value, ensure_ascii=False))
+
+    def _to_table(self, frame):
+        """Convert a DataFrame chunk to an Arrow table whose types the writer can fix for the whole file"""
+        frame = frame.copy()
+        for column in frame.columns[frame.dtypes == object]:
+            frame[column] = self._encode_object_column(frame[column])
+        table = self.pa.Table.from_pandas(frame, preserve_index=False)
+
+        # Untyped all-null columns carry no type of their own; the writer stores them as text
+        for i, column in enumerate(table.columns):
+            untyped = frame.dtypes.iloc[i] == object or frame.dtypes.iloc[i] == 'float64'
+            if untyped and len(table) and column.null_count == len(table):
+                table = table.set_column(i, table.field(i).name, self.pa.nulls(len(table)))
+        return table
+
+    def open_writer(self, filepath, template=None):
+        """Start writing a table chunk by chunk; an empty template DataFrame fixes the column types"""
+        return ParquetWriter(self, filepath, template)
+
+    def write_chunks(self, filepath, frames, template=None):
+        """Stream DataFrame chunks into one compressed Parquet file, returning the number of rows written"""
+        writer = self.open_writer(filepath, template)
+        for frame in frames:
+            writer.write(frame)
+        return writer.close()
+
+    def read(self, filepath, columns=None, memory_map=False):
+        """Read a Parquet file, loading only the requested columns"""
+        return self.pq.read_table(filepath, columns=columns, memory_map=memory_map).to_pandas()
+
+BACKENDS = {
+    'csv': CsvStorage,
+    'parquet': ParquetStorage,
+}
+
+def get_storage(name=None):
+    """Return the storage backend for a format name, falling back to CSV if pyarrow is missing"""
+    name = name or DEFAULT_FORMAT
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage format '{name}'. Choose from: {', '.join(BACKENDS)}")
+    try:
+        return BACKENDS[name]()
+    except ImportError:
+        logger.warning("pyarrow is not installed, storing %s data as CSV instead", name)
+        return CsvStorage()
+
+def storage_for_path(filepath):
+    """Pick the backend that can read an existing file from its extension"""
+    for backend in BACKENDS.values():
+        if filepath.endswith(backend.extension):
+            return backend()
+    raise ValueError(f"No storage backend for {filepath}")
+
+def read_frame(filepath, columns=None, memory_map=False):
+    """Read a stored DataFrame in whatever format it was written"""
+    return storage_for_path(filepath).read(filepath, columns=columns, memory_map=memory_map)
+
+def export_csv(filepath, csv_path=None):
+    """Export a stored DataFrame to CSV, returning the CSV path"""
+    csv_path = csv_path or os.path.splitext(filepath)[0] + '.csv'
+    read_frame(filepath).to_csv(csv_path, index=False)
+    return csv_path
@@ -0,0 +1,127 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from data_fetcher import WaniKaniDataFetcher
+from data_processor import WaniKaniDataProcessor
+from storage import get_storage, read_frame
+
+logger = logging.getLogger(__name__)
+
+class SubjectCatalog:
+    def __init__(self, data_root="data/shared", refresh_hours=24, storage_format=None):
+        self.data_root = data_root  # Shared by every account; subjects are the same curriculum for everyone
+        self.refresh_interval = timedelta(hours=refresh_hours)
+        self.manifest_path = os.path.join(data_root, "subject_index.json")
+        self.storage = get_storage(storage_format)
+        self.index = None  # DataFrame indexed by subject id
+        self.version = None  # Content hash of the raw subjects snapshot the index was built from
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        os.makedirs(self.data_root, exist_ok=True)
+
+    def _load_manifest_index(self, reload=False):
+        """Read the index the manifest points at, if one has been built; reload picks up another process's refresh"""
+        if (self.index is None or reload) and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if self.index is None or manifest['version'] != self.version:
+                if not os.path.exists(manifest['path']):
+                    return
+                self.index = self._restore_dtypes(read_frame(manifest['path'], memory_map=True).set_index('id'))
+                self.version = manifest['version']
+            self.refreshed_at = datetime.fromisoformat(manifest.get('refreshed_at', manifest['built_at']))
+
+    def _is_fresh(self):
+        return self.index is not None and datetime.now() - self.refreshed_at < self.refresh_interval
+
+    def load(self):
+        """Load the most recently built index from disk without touching the API"""
+        with self.lock:
+            self._load_manifest_index()
+            return self.index
+
+    def refresh(self, api_key, force=False, scheduler=None):
+        """Incrementally sync subjects with any valid key and rebuild the index if they changed.
+
+        Pass the scheduler the caller uses for the same key so both share its rate limit. Every worker
+        process shares data_root, so one refreshes under a lock on .refresh.lock and the others wait
+        and then load what it built.
+        """
+        with self.lock:
+            self._load_manifest_index()
+            if not force and self._is_fresh():
+                return self.index
+
+            with open(os.path.join(self.data_root, '.refresh.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._load_manifest_index(reload=True)
+                if not force and self._is_fresh():
+                    return self.index
+
+                # The fetcher's delta sync and the processor's content-hash skip keep refreshes cheap
+                fetcher = WaniKaniDataFetcher(api_key=api_key, data_root=self.data_root, scheduler=scheduler,
+                                              cache_duration_hours=self.refresh_interval.total_seconds() / 3600)
+                fetcher.fetch_and_save('subjects')
+                processor = WaniKaniDataProcessor(data_root=self.data_root, catalog=fetcher.catalog)
+                entry = processor.catalog.latest('raw', 'subjects')
+                processor.process_snapshot(entry)
+
+                if entry['content_hash'] != self.version:
+                    logger.info("Building subject index for version %s", entry['content_hash'][:12])
+                    self.index = self._build_index(processor)
+                    self.version = entry['content_hash']
+                    index = self.index.reset_index()
+                    self.storage.write_chunks(self._index_path(), [index], template=index.iloc[:0])
+                self.refreshed_at = datetime.now()
+                self._save_manifest()
+            return self.index
+
+    def _build_index(self, processor):
+        """Compact subject id -> level, type, characters, meanings and SRS system table"""
+        subjects = processor.load_curated('subjects', columns=['id', 'object', 'level', 'characters', 'slug',
+                                                               'spaced_repetition_system_id', 'hidden_at'])
+        meanings = processor.load_curated('subjects_meanings', columns=['subject_id', 'position', 'meaning', 'primary'])
+
+        meanings = meanings.sort_values(['subject_id', 'position'])
+        primary = meanings[meanings['primary'].fillna(False)].drop_duplicates('subject_id').set_index('subject_id')['meaning']
+        all_meanings = meanings.groupby('subject_id')['meaning'].agg(', '.join)
+
+        index = subjects.rename(columns={'object': 'type'}).set_index('id').sort_index()
+        index['hidden'] = index.pop('hidden_at').notna()
+        index['meaning'] = primary.reindex(index.index)
+        index['meanings'] = all_meanings.reindex(index.index)
+        return self._restore_dtypes(index)
+
+    def _restore_dtypes(self, index):
+        """Small integer and categorical dtypes keep the index compact in memory"""
+        index.index = index.index.astype('int32')
+        index.index.name = 'id'
+        index['level'] = index['level'].astype('Int8')
+        index['type'] = index['type'].astype('category')
+        if 'spaced_repetition_system_id' in index:
+            index['spaced_repetition_system_id'] = index['spaced_repetition_system_id'].astype('Int8')
+        for column in ['characters', 'slug', 'meaning', 'meanings']:
+            index[column] = index[column].astype('string')
+        return index
+
+    def _index_path(self):
+        return os.path.join(self.data_root, f"subject_index_{self.version[:12]}{self.storage.extension}")
+
+    def _save_manifest(self):
+        """Point the manifest at the current index and record when it was last refreshed"""
+        built_at = datetime.fromtimestamp(os.path.getmtime(self._index_path()))
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_root, prefix='.subject_index.', suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'path': self._index_path(), 'built_at': built_at.isoformat(),
+                       'refreshed_at': self.refreshed_at.isoformat()}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def lookup(self, subject_ids):
+        """Subject details for a sequence of ids, in the same order"""
+        if self.index is None:
+            raise RuntimeError("Subject catalog has not been loaded")
+        return self.index.reindex(subject_ids)
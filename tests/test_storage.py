@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from flattening import flatten_records
+from storage import CsvStorage, ParquetStorage
+
+pytest.importorskip('pyarrow')
+
+def test_untyped_chunks_that_differ_from_the_first(tmp_path):
+    storage = ParquetStorage()
+    path = str(tmp_path / 'table.parquet')
+    rows = storage.write_chunks(path, [
+        pd.DataFrame({'count': [1, 2], 'kind': pd.Categorical([None, None]), 'note': [None, None]}),
+        pd.DataFrame({'count': [1.5, None], 'kind': pd.Categorical(['a', 'b']), 'note': ['x', None]}),
+    ])
+    frame = storage.read(path)
+    assert rows == 4
+    assert frame['count'].tolist()[:3] == [1.0, 2.0, 1.5] and pd.isna(frame['count'].iloc[3])
+    assert frame['kind'].tolist()[2:] == ['a', 'b']
+    assert frame['note'].tolist()[2:] == ['x', None]
+
+def test_typed_chunks_keep_the_endpoint_schema(tmp_path):
+    storage = ParquetStorage()
+    templates = flatten_records('subjects', [])
+    first = flatten_records('subjects', [{'id': 1, 'object': 'kanji', 'data': {
+        'level': 1, 'auxiliary_meanings': [{'meaning': 'one', 'type': None}]}}])
+    second = flatten_records('subjects', [{'id': 2, 'object': 'vocabulary', 'data': {
+        'level': 2, 'auxiliary_meanings': [{'meaning': 'two', 'type': 'whitelist'}]}}])
+    for table_name in ['subjects', 'subjects_auxiliary_meanings']:
+        path = str(tmp_path / f'{table_name}.parquet')
+        writer = storage.open_writer(path, templates[table_name])
+        writer.write(first[table_name])
+        writer.write(second[table_name])
+        assert writer.close() == 2
+
+    subjects = storage.read(str(tmp_path / 'subjects.parquet'))
+    assert str(subjects['level'].dtype) == 'Int16'
+    assert subjects['object'].tolist() == ['kanji', 'vocabulary']
+    meanings = storage.read(str(tmp_path / 'subjects_auxiliary_meanings.parquet'))
+    assert pd.isna(meanings['type'].iloc[0]) and meanings['type'].iloc[1] == 'whitelist'
+
+def test_csv_template_fixes_the_header(tmp_path):
+    path = str(tmp_path / 'table.csv')
+    template = pd.DataFrame({'a': pd.Series(dtype='Int64'), 'b': pd.Series(dtype='string')})
+    CsvStorage().write_chunks(path, [pd.DataFrame({'b': ['x']}), pd.DataFrame({'a': [1]})], template=template)
+    assert pd.read_csv(path).columns.tolist() == ['a', 'b']